@@ -0,0 +1,117 @@
+import sys
+from collections import deque
+from math import isqrt
+from typing import Callable, Iterable, Iterator, TextIO
+
+import engine
+import gamelog
+from bitboard import MARKS, BitBoard
+
+# Batch analysis of position dumps. Text input has one position per line, in
+# the format of the old best move cache keys: the marks of the cells row by
+# row, a space for an empty one, then the mark of the player to move, e.g.
+# "x   o    x" for a 3x3 board. Boards are square and need the win length if it
+# is not their size. Game logs are read as every position a move was made in.
+#
+# Every position gives one tab-separated line of output: the key, the best
+# move as "<x> <y>" (or "-" once the game is over), the score for the player
+# to move and the search depth. Lines go out as soon as their position is
+# searched, in input order. A malformed text line is reported with its line
+# number and skipped, so one bad line does not cost the rest of a dump.
+
+
+def parse_position(key: str, win_length: int = None) -> BitBoard:
+    size = isqrt(len(key) - 1) if key else 0
+    if not size or size * size + 1 != len(key):
+        raise ValueError(f"{key!r} is not a square board and a player.")
+    if key[-1] not in MARKS or any(mark not in (" ", *MARKS) for mark in key[:-1]):
+        raise ValueError(f"{key!r} has marks other than {' and '.join(MARKS)}.")
+    rows = tuple(
+        tuple(mark if mark != " " else None for mark in key[y * size : (y + 1) * size])
+        for y in range(size)
+    )
+    position = BitBoard.from_rows(rows, win_length)
+    if MARKS[engine.side_to_move(position)] != key[-1]:
+        raise ValueError(f"{key!r} cannot be {key[-1]!r} to move.")
+    return position
+
+
+def format_position(position: BitBoard) -> str:
+    return "".join(
+        [mark if mark else " " for row in position.to_rows() for mark in row]
+        + [MARKS[engine.side_to_move(position)]]
+    )
+
+
+def read_positions(
+    lines: Iterable[str],
+    win_length: int = None,
+    report: Callable[[str], None] = None,
+) -> Iterator[BitBoard]:
+    report = report if report is not None else _print_to_stderr
+    for line_number, line in enumerate(lines, 1):
+        # Spaces are empty cells, only the line break is not part of a key.
+        key = line.rstrip("\r\n")
+        if not key:
+            continue
+        try:
+            position = parse_position(key, win_length)
+        except ValueError as error:
+            report(f"Skipped line {line_number}: {error}")
+            continue
+        yield position
+
+
+def read_logged_positions(path: str) -> Iterator[BitBoard]:
+    for record in gamelog.read_games(path):
+        position = BitBoard(record.width, record.height, record.win_length)
+        for ply, index in enumerate(record.moves):
+            yield position.copy()
+            position.make_index_move(index, ply % 2)
+
+
+def open_positions(
+    path: str, win_length: int = None, report: Callable[[str], None] = None
+) -> Iterator[BitBoard]:
+    # "-" reads text from the standard input, a file starting like a game log
+    # is read as one.
+    if path == "-":
+        yield from read_positions(sys.stdin, win_length, report)
+        return
+    with open(path, "rb") as position_file:
+        is_game_log = position_file.read(len(gamelog.MAGIC)) == gamelog.MAGIC
+    if is_game_log:
+        yield from read_logged_positions(path)
+        return
+    with open(path, newline="") as position_file:
+        yield from read_positions(position_file, win_length, report)
+
+
+def format_result(position: BitBoard, result: engine.SearchResult) -> str:
+    move = f"{result.move[0]} {result.move[1]}" if result.move else "-"
+    return f"{format_position(position)}\t{move}\t{result.score}\t{result.depth}"
+
+
+def analyze(
+    positions: Iterable[BitBoard],
+    analysis_engine: engine.Engine,
+    workers: int = 1,
+    output: TextIO = sys.stdout,
+) -> int:
+    # Returns the number of positions analyzed.
+    searched = deque()  # positions given to the engine, not yet written out
+    count = 0
+
+    def remember(unread: Iterable[BitBoard]) -> Iterator[BitBoard]:
+        for position in unread:
+            searched.append(position)
+            yield position
+
+    for result in analysis_engine.iter_search(remember(positions), workers):
+        output.write(format_result(searched.popleft(), result) + "\n")
+        count += 1
+    return count
+
+
+def _print_to_stderr(message: str) -> None:
+    print(message, file=sys.stderr)
@@ -0,0 +1,248 @@
+import json
+import os
+import platform
+import sys
+import tempfile
+from time import perf_counter
+from typing import Callable, TextIO
+
+import book
+import connect_four
+import randomness
+import search
+import solver
+import tictactoe
+import tournament
+import transposition
+from bitboard import BitBoard, MaskBoard, get_geometry
+
+FORMAT_VERSION = 1  # of the JSON output, raised when its layout changes
+SEED = 1  # every benchmark replays the same positions and games
+
+# Fixed-depth searches from fixed positions: name, width, height, win length,
+# moves as cell indices and depth.
+SEARCH_POSITIONS = (
+    ("3x3 empty", 3, 3, 3, (), 9),
+    ("4x4 four in a row", 4, 4, 4, (), 9),
+    ("5x5 four in a row", 5, 5, 4, (12, 6), 7),
+    ("7x7 five in a row", 7, 7, 5, (24, 16, 25), 5),
+)
+# Board shapes and depths of the move generation counts.
+PERFT_BOARDS = ((3, 3, 3, 9), (4, 4, 3, 5), (5, 5, 4, 4), (7, 7, 5, 3))
+CONNECT_FOUR_PERFT_DEPTH = 7
+CONNECT_FOUR_SEARCH_DEPTH = 9
+SOLVE_BOARDS = ((3, 3, 3),)
+MINIMAX_BOARD = (4, 4, 3)
+CACHE_OPERATIONS = 1 << 16
+# Bot pairings, with the games played by each.
+TOURNAMENT_PAIRINGS = ((1, 1, 1 << 16), (3, 1, 200))
+TOURNAMENT_TIME_LIMIT = 0.01
+
+# Repeatable measurements of the engine, for comparing commits: every
+# benchmark returns a dict of counts and timings, and run_benchmarks writes all
+# of them as one JSON document. Counts (nodes, perft leaves, positions) must
+# not change unless the search or the rules do, rates and times are only
+# comparable on the same machine.
+
+
+def benchmark_search() -> dict:
+    # Fresh tables for every position, so that no search profits from another.
+    results = {}
+    for name, width, height, win_length, moves, depth in SEARCH_POSITIONS:
+        board = BitBoard(width, height, win_length)
+        for ply, index in enumerate(moves):
+            board.make_index_move(index, ply % 2)
+        results[name] = _search_to_depth(board, len(moves) % 2, depth)
+    results["connect four empty"] = _search_to_depth(
+        connect_four.ConnectFourBoard(), 0, CONNECT_FOUR_SEARCH_DEPTH
+    )
+    return results
+
+
+def _search_to_depth(board, player: int, depth: int) -> dict:
+    searcher = search.Searcher(time_limit=None, max_depth=depth)
+    start = perf_counter()
+    move, score, completed_depth = searcher.search(board, player)
+    seconds = perf_counter() - start
+    return {
+        "depth": completed_depth,
+        "move": move,
+        "score": score,
+        "nodes": searcher.stats.nodes,
+        "seconds": seconds,
+        "nodes_per_second": searcher.stats.nodes / seconds,
+    }
+
+
+def benchmark_minimax() -> dict:
+    # The exhaustive bot's first move, which searches the whole game tree.
+    board = BitBoard(*MINIMAX_BOARD)
+    tictactoe.transposition_table.clear()
+    start = perf_counter()
+    tictactoe.minimax_best_move(board, True)
+    seconds = perf_counter() - start
+    return {
+        "table_entries": len(tictactoe.transposition_table),
+        "seconds": seconds,
+    }
+
+
+def benchmark_solve() -> dict:
+    results = {}
+    for width, height, win_length in SOLVE_BOARDS:
+        start = perf_counter()
+        book_moves = solver.solve(
+            get_geometry(width, height, win_length), report=solver.ignore_report
+        )
+        seconds = perf_counter() - start
+        results[f"{width}x{height}x{win_length}"] = {
+            "positions": len(book_moves),
+            "seconds": seconds,
+            "positions_per_second": len(book_moves) / seconds,
+        }
+    return results
+
+
+def perft(board: MaskBoard, player: int, depth: int) -> int:
+    # Move sequences of `depth` plies from the position, a game that is over
+    # is not played on. The last ply is counted without being played: its
+    # moves are legal whatever they lead to.
+    if depth == 0:
+        return 1
+    moves = board.get_legal_indices()
+    if depth == 1:
+        return len(moves)
+    leaves = 0
+    for index in moves:
+        board.make_index_move(index, player)
+        if not board.is_winning() and not board.is_draw():
+            leaves += perft(board, 1 - player, depth - 1)
+        board.unmake_move()
+    return leaves
+
+
+def benchmark_perft() -> dict:
+    results = {}
+    for width, height, win_length, max_depth in PERFT_BOARDS:
+        board = BitBoard(width, height, win_length)
+        counts = []
+        start = perf_counter()
+        for depth in range(1, max_depth + 1):
+            counts.append(perft(board, 0, depth))
+        seconds = perf_counter() - start
+        results[f"{width}x{height}x{win_length}"] = {
+            "leaves": counts,
+            "seconds": seconds,
+            "leaves_per_second": sum(counts) / seconds,
+        }
+    board = connect_four.ConnectFourBoard()
+    counts = []
+    start = perf_counter()
+    for depth in range(1, CONNECT_FOUR_PERFT_DEPTH + 1):
+        counts.append(perft(board, 0, depth))
+    seconds = perf_counter() - start
+    results["connect four"] = {
+        "leaves": counts,
+        "seconds": seconds,
+        "leaves_per_second": sum(counts) / seconds,
+    }
+    return results
+
+
+def benchmark_cache() -> dict:
+    # Nanoseconds per lookup in the transposition table and the opening book,
+    # of keys that are stored and of keys that are not.
+    rng = randomness.RNG_TYPES["fast"](SEED)
+    stored = [rng.getrandbits(64) for _ in range(CACHE_OPERATIONS)]
+    missing = [rng.getrandbits(64) for _ in range(CACHE_OPERATIONS)]
+    table = transposition.TranspositionTable(4 * CACHE_OPERATIONS)
+    for key in stored:
+        table.store(key, 0, transposition.EXACT, 1, 0)
+    results = {
+        "table_hit_ns": _nanoseconds_per_call(table.probe, stored, 1, None, None),
+        "table_miss_ns": _nanoseconds_per_call(table.probe, missing, 1, None, None),
+    }
+    geometry = get_geometry(3, 3, 3)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "benchmark.book")
+        book.write_book(path, geometry, {key: 0 for key in stored})
+        opening_book = book.OpeningBook(path, geometry)
+        results["book_hit_ns"] = _nanoseconds_per_call(opening_book.get, stored)
+        results["book_miss_ns"] = _nanoseconds_per_call(opening_book.get, missing)
+        opening_book.close()
+    return results
+
+
+def benchmark_tournament() -> dict:
+    # Single process games, bot types as in main.py.
+    results = {}
+    time_limit = tictactoe.searcher.time_limit
+    tictactoe.searcher.time_limit = TOURNAMENT_TIME_LIMIT
+    try:
+        for bot_one, bot_two, games in TOURNAMENT_PAIRINGS:
+            start = perf_counter()
+            match_results = tournament.play_match(
+                bot_one,
+                bot_two,
+                tictactoe.TicTacToeGame,
+                3,
+                games,
+                seed=SEED,
+                report=solver.ignore_report,
+            )
+            seconds = perf_counter() - start
+            results[f"{bot_one} vs {bot_two}"] = {
+                "games": games,
+                "results": match_results,
+                "seconds": seconds,
+                "games_per_second": games / seconds,
+            }
+    finally:
+        tictactoe.searcher.time_limit = time_limit
+    return results
+
+
+BENCHMARKS = {
+    "search": benchmark_search,
+    "minimax": benchmark_minimax,
+    "solve": benchmark_solve,
+    "perft": benchmark_perft,
+    "cache": benchmark_cache,
+    "tournament": benchmark_tournament,
+}
+
+
+def run_benchmarks(
+    names: list[str] = None,
+    output: TextIO = sys.stdout,
+    report: Callable[[str], None] = print,
+) -> dict:
+    # All benchmarks if no names are given.
+    names = names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        raise ValueError(
+            f"Unknown benchmarks {', '.join(unknown)},"
+            f" there are {', '.join(BENCHMARKS)}."
+        )
+    results = {}
+    for name in names:
+        report(f"Running the {name} benchmark.")
+        randomness.use_rng("fast", SEED)
+        results[name] = BENCHMARKS[name]()
+    document = {
+        "format_version": FORMAT_VERSION,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": results,
+    }
+    json.dump(document, output, indent=2)
+    output.write("\n")
+    return document
+
+
+def _nanoseconds_per_call(function: Callable, keys: list, *args) -> float:
+    start = perf_counter()
+    for key in keys:
+        function(key, *args)
+    return (perf_counter() - start) * 1e9 / len(keys)
@@ -0,0 +1,368 @@
+import random
+from functools import cache, cached_property
+
+# Bit i of a mask is the cell (x, y) with i == y * width + x, so iterating the
+# set bits from low to high walks the board in row-major order.
+MARKS = ("x", "o")  # index 0: maximizing player, index 1: minimizing player
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+LINE_WEIGHTS = [4**count - 1 for count in range(64)]
+
+
+class BoardGeometry:
+    def __init__(self, width: int, height: int, win_length: int):
+        if win_length > max(width, height):
+            raise ValueError(
+                f"Cannot get {win_length} in a row on a {width}x{height} board."
+            )
+        self.width = width
+        self.height = height
+        self.win_length = win_length
+        self.cell_count = width * height
+        self.full_mask = (1 << self.cell_count) - 1
+        self.win_lines = self._build_win_lines()
+        # Only the lines through the cell just played can have been completed
+        # by that move, so win checks after a move look at these alone.
+        self.cell_lines = [
+            [line for line in self.win_lines if line >> index & 1]
+            for index in range(self.cell_count)
+        ]
+
+    def _build_win_lines(self) -> list[int]:
+        win_lines = []
+        for y in range(self.height):
+            for x in range(self.width):
+                for dx, dy in DIRECTIONS:
+                    end_x = x + dx * (self.win_length - 1)
+                    end_y = y + dy * (self.win_length - 1)
+                    if not (0 <= end_x < self.width and 0 <= end_y < self.height):
+                        continue
+                    line = 0
+                    for i in range(self.win_length):
+                        line |= self.cell_bit((x + dx * i, y + dy * i))
+                    win_lines.append(line)
+        return win_lines
+
+    @cached_property
+    def cell_line_indices(self) -> list[list[int]]:
+        # Per cell, the positions in win_lines of the lines through it.
+        return [
+            [number for number, line in enumerate(self.win_lines) if line >> index & 1]
+            for index in range(self.cell_count)
+        ]
+
+    @cache
+    def neighbourhood(self, index: int, distance: int) -> list[int]:
+        # The cells at most `distance` steps away in any direction, the cell
+        # itself included.
+        x, y = self.index_to_move(index)
+        return [
+            self.cell_index((nx, ny))
+            for ny in range(max(y - distance, 0), min(y + distance + 1, self.height))
+            for nx in range(max(x - distance, 0), min(x + distance + 1, self.width))
+        ]
+
+    @cached_property
+    def symmetries(self) -> list[list[int]]:
+        # Cell permutations mapping the board onto itself, identity first.
+        # Rectangles have 4 (mirrors and half turn), squares all 8.
+        w, h = self.width - 1, self.height - 1
+        transforms = [
+            lambda x, y: (x, y),
+            lambda x, y: (w - x, y),
+            lambda x, y: (x, h - y),
+            lambda x, y: (w - x, h - y),
+        ]
+        if self.width == self.height:
+            transforms += [
+                lambda x, y: (y, x),
+                lambda x, y: (h - y, x),
+                lambda x, y: (y, w - x),
+                lambda x, y: (h - y, w - x),
+            ]
+        return [
+            [
+                self.cell_index(transform(*self.index_to_move(index)))
+                for index in range(self.cell_count)
+            ]
+            for transform in transforms
+        ]
+
+    @cached_property
+    def inverse_symmetries(self) -> list[list[int]]:
+        inverses = []
+        for permutation in self.symmetries:
+            inverse = [0] * self.cell_count
+            for index, image in enumerate(permutation):
+                inverse[image] = index
+            inverses.append(inverse)
+        return inverses
+
+    @cached_property
+    def centre_distances(self) -> list[int]:
+        # Doubled Manhattan distance of each cell from the centre of the board.
+        return [
+            abs(2 * x - self.width + 1) + abs(2 * y - self.height + 1)
+            for x, y in map(self.index_to_move, range(self.cell_count))
+        ]
+
+    @cached_property
+    def _symmetry_tables(self) -> list[list[list[int]]]:
+        # Per symmetry and per byte of the mask, the transformed bits of every
+        # possible byte value, so a whole mask transforms in cell_count / 8
+        # lookups.
+        tables = []
+        for permutation in self.symmetries:
+            chunk_tables = []
+            for chunk_start in range(0, self.cell_count, 8):
+                chunk_table = [0] * 256
+                for byte in range(1, 256):
+                    lowest = byte & -byte
+                    index = chunk_start + lowest.bit_length() - 1
+                    if index < self.cell_count:
+                        chunk_table[byte] = chunk_table[byte ^ lowest] | (
+                            1 << permutation[index]
+                        )
+                    else:
+                        chunk_table[byte] = chunk_table[byte ^ lowest]
+                chunk_tables.append(chunk_table)
+            tables.append(chunk_tables)
+        return tables
+
+    @cached_property
+    def zobrist_keys(self) -> list[list[int]]:
+        # Seeded by the board shape so hashes are stable across runs and can
+        # key persistent caches.
+        rng = random.Random(f"{self.width}x{self.height}x{self.win_length}")
+        return [
+            [rng.getrandbits(64) for _ in range(self.cell_count)] for _ in MARKS
+        ]
+
+    @cached_property
+    def side_key(self) -> int:
+        return random.Random(
+            f"{self.width}x{self.height}x{self.win_length} side"
+        ).getrandbits(64)
+
+    @cached_property
+    def symmetric_zobrist_keys(self) -> list[list[tuple[int, ...]]]:
+        # Per player and cell, the key of that cell's image under every
+        # symmetry, so a board can update the hash of all its images at once.
+        return [
+            [
+                tuple(
+                    player_keys[permutation[index]] for permutation in self.symmetries
+                )
+                for index in range(self.cell_count)
+            ]
+            for player_keys in self.zobrist_keys
+        ]
+
+    def transform(self, bits: int, symmetry: int) -> int:
+        transformed = 0
+        for chunk_table in self._symmetry_tables[symmetry]:
+            transformed |= chunk_table[bits & 0xFF]
+            bits >>= 8
+        return transformed
+
+    def canonical_masks(self, masks: tuple[int, int]) -> tuple[tuple[int, int], int]:
+        # The smallest image of the position under the board's symmetries and
+        # the symmetry that produces it.
+        best, best_symmetry = tuple(masks), 0
+        for symmetry in range(1, len(self.symmetries)):
+            image = self.transform(masks[0], symmetry), self.transform(
+                masks[1], symmetry
+            )
+            if image < best:
+                best, best_symmetry = image, symmetry
+        return best, best_symmetry
+
+    def cell_index(self, move: tuple[int, int]) -> int:
+        return move[1] * self.width + move[0]
+
+    def cell_bit(self, move: tuple[int, int]) -> int:
+        return 1 << self.cell_index(move)
+
+    def index_to_move(self, index: int) -> tuple[int, int]:
+        return index % self.width, index // self.width
+
+    def is_on_board(self, move: tuple[int, int]) -> bool:
+        return 0 <= move[0] < self.width and 0 <= move[1] < self.height
+
+    def has_line_through(self, bits: int, index: int) -> bool:
+        for line in self.cell_lines[index]:
+            if bits & line == line:
+                return True
+        return False
+
+    def has_line(self, bits: int) -> bool:
+        for line in self.win_lines:
+            if bits & line == line:
+                return True
+        return False
+
+    def iter_indices(self, bits: int):
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+
+    def iter_empty_indices(self, occupied: int):
+        return self.iter_indices(self.full_mask & ~occupied)
+
+
+@cache
+def get_geometry(width: int, height: int, win_length: int) -> BoardGeometry:
+    return BoardGeometry(width, height, win_length)
+
+
+# What every board keeping one mask per player shares, whatever the layout of
+# its bits: subclasses set geometry (with win_lines, full_mask, side_key and
+# cell_bit), masks, history and hashes, the Zobrist hash of the position under
+# each symmetry of the board with the identity first, and implement the moves
+# and find_winner.
+class MaskBoard:
+    def to_rows(self) -> tuple[tuple[str | None]]:
+        geometry = self.geometry
+        return tuple(
+            tuple(self.get_mark((x, y)) for x in range(geometry.width))
+            for y in range(geometry.height)
+        )
+
+    def copy(self) -> "MaskBoard":
+        geometry = self.geometry
+        board = type(self)(
+            geometry.width, geometry.height, geometry.win_length, tuple(self.masks)
+        )
+        board.history = self.history.copy()
+        return board
+
+    def position_key(self, is_maximizing_players_turn: bool) -> int:
+        return self.hashes[0] ^ (
+            0 if is_maximizing_players_turn else self.geometry.side_key
+        )
+
+    def canonical_key(self, is_maximizing_players_turn: bool) -> int:
+        # The same for every rotation and reflection of the position.
+        return min(self.hashes) ^ (
+            0 if is_maximizing_players_turn else self.geometry.side_key
+        )
+
+    def canonical_symmetry(self) -> int:
+        # The symmetry mapping this position onto the one canonical_key hashes.
+        return self.hashes.index(min(self.hashes))
+
+    def side_to_move(self) -> int:
+        # 0 for "x", who moves first, 1 for "o".
+        x_mask, o_mask = self.masks
+        return 0 if x_mask.bit_count() == o_mask.bit_count() else 1
+
+    @property
+    def occupied(self) -> int:
+        return self.masks[0] | self.masks[1]
+
+    def get_mark(self, move: tuple[int, int]) -> str | None:
+        bit = self.geometry.cell_bit(move)
+        for mark, mask in zip(MARKS, self.masks):
+            if mask & bit:
+                return mark
+        return None
+
+    def is_winning(self) -> bool:
+        return self.find_winner() is not None
+
+    def is_draw(self) -> bool:
+        return self.occupied == self.geometry.full_mask
+
+    def evaluate(self, player: int) -> int:
+        # Lines still open for one side only, weighted by how filled they are,
+        # from the point of view of player.
+        own, other = self.masks[player], self.masks[1 - player]
+        score = 0
+        for line in self.geometry.win_lines:
+            if not line & other:
+                score += LINE_WEIGHTS[(line & own).bit_count()]
+            elif not line & own:
+                score -= LINE_WEIGHTS[(line & other).bit_count()]
+        return score
+
+
+class BitBoard(MaskBoard):
+    def __init__(
+        self,
+        width: int,
+        height: int = None,
+        win_length: int = None,
+        masks: tuple[int, int] = (0, 0),
+    ):
+        height = height if height else width
+        win_length = win_length if win_length else min(width, height)
+        self.geometry = get_geometry(width, height, win_length)
+        self.masks = list(masks)
+        # (player index, cell index) per move, newest last, for unmake_move
+        # and for checking only the last move's lines in is_winning.
+        self.history = []
+        # Zobrist hash of the position under each symmetry of the board, the
+        # identity first. Moves update all of them with one XOR each.
+        self.hashes = [0] * len(self.geometry.symmetries)
+        for player, mask in enumerate(self.masks):
+            for index in self.geometry.iter_indices(mask):
+                self._toggle_hashes(player, index)
+
+    @classmethod
+    def from_rows(
+        cls, rows: tuple[tuple[str | None]], win_length: int = None
+    ) -> "BitBoard":
+        width = len(rows[0])
+        masks = [0, 0]
+        for y, row in enumerate(rows):
+            for x, mark in enumerate(row):
+                if mark:
+                    masks[MARKS.index(mark)] |= 1 << (y * width + x)
+        return cls(width, len(rows), win_length, tuple(masks))
+
+    def _toggle_hashes(self, player: int, index: int) -> None:
+        self.hashes = [
+            position_hash ^ key
+            for position_hash, key in zip(
+                self.hashes, self.geometry.symmetric_zobrist_keys[player][index]
+            )
+        ]
+
+    def make_move(
+        self, move: tuple[int, int], is_maximizing_players_turn: bool
+    ) -> None:
+        self.make_index_move(
+            self.geometry.cell_index(move), 0 if is_maximizing_players_turn else 1
+        )
+
+    def make_index_move(self, index: int, player: int) -> None:
+        self.masks[player] |= 1 << index
+        self.history.append((player, index))
+        self._toggle_hashes(player, index)
+
+    def unmake_move(self) -> None:
+        player, index = self.history.pop()
+        self.masks[player] &= ~(1 << index)
+        self._toggle_hashes(player, index)
+
+    def find_winner(self) -> str | None:
+        if self.history:
+            player, index = self.history[-1]
+            if self.geometry.has_line_through(self.masks[player], index):
+                return MARKS[player]
+            return None
+        # Boards set up without a move history (e.g. from rows) need a full scan.
+        for mark, mask in zip(MARKS, self.masks):
+            if self.geometry.has_line(mask):
+                return mark
+        return None
+
+    def get_legal_indices(self) -> list[int]:
+        return list(self.geometry.iter_empty_indices(self.occupied))
+
+    def get_legal_moves(self) -> list[tuple[int, int]]:
+        geometry = self.geometry
+        return [
+            geometry.index_to_move(index)
+            for index in geometry.iter_empty_indices(self.occupied)
+        ]
@@ -0,0 +1,114 @@
+import mmap
+import os
+import struct
+from typing import Iterator
+
+from bitboard import BitBoard, BoardGeometry
+
+BOOK_MAGIC = b"ABMN"
+BOOK_VERSION = 1
+# magic, version, width, height, win length, entry count
+HEADER = struct.Struct("<4sHHHHQ")
+# canonical position key, best move index in the canonical orientation
+ENTRY = struct.Struct("<QH")
+BOOK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_book_path(geometry: BoardGeometry) -> str:
+    return os.path.join(
+        BOOK_DIR, f"book_{geometry.width}x{geometry.height}x{geometry.win_length}.bin"
+    )
+
+
+# Best moves of a board shape in one file of fixed-width entries sorted by
+# key. The file is mapped into memory and binary searched in place, so
+# opening it costs no parsing and a lookup touches a handful of pages.
+class OpeningBook:
+    def __init__(self, path: str, geometry: BoardGeometry):
+        self.path = path
+        with open(path, "rb") as book_file:
+            self.data = mmap.mmap(book_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, width, height, win_length, self.entry_count = (
+            HEADER.unpack_from(self.data)
+        )
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {BOOK_VERSION} book.")
+        if (width, height, win_length) != (
+            geometry.width,
+            geometry.height,
+            geometry.win_length,
+        ):
+            self.close()
+            raise ValueError(
+                f"{path} is a book for {width}x{height} boards with"
+                f" {win_length} in a row."
+            )
+        if len(self.data) != HEADER.size + self.entry_count * ENTRY.size:
+            self.close()
+            raise ValueError(f"{path} is truncated.")
+
+    def __len__(self) -> int:
+        return self.entry_count
+
+    def close(self) -> None:
+        self.data.close()
+
+    def items(self) -> Iterator[tuple[int, int]]:
+        # (key, move) of every entry, in key order.
+        for i in range(self.entry_count):
+            yield ENTRY.unpack_from(self.data, HEADER.size + i * ENTRY.size)
+
+    def get(self, key: int) -> int | None:
+        low, high = 0, self.entry_count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, move = ENTRY.unpack_from(
+                self.data, HEADER.size + middle * ENTRY.size
+            )
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return move
+        return None
+
+    def get_move(
+        self, bit_board: BitBoard, is_maximizing_players_turn: bool
+    ) -> int | None:
+        canonical_move = self.get(bit_board.canonical_key(is_maximizing_players_turn))
+        if canonical_move is None:
+            return None
+        return bit_board.geometry.inverse_symmetries[bit_board.canonical_symmetry()][
+            canonical_move
+        ]
+
+
+def load_book(geometry: BoardGeometry) -> OpeningBook | None:
+    path = get_book_path(geometry)
+    if not os.path.exists(path):
+        return None
+    return OpeningBook(path, geometry)
+
+
+def write_book(path: str, geometry: BoardGeometry, moves: dict[int, int]) -> None:
+    # moves maps canonical position keys to best moves in canonical orientation.
+    data = bytearray(HEADER.size + len(moves) * ENTRY.size)
+    HEADER.pack_into(
+        data,
+        0,
+        BOOK_MAGIC,
+        BOOK_VERSION,
+        geometry.width,
+        geometry.height,
+        geometry.win_length,
+        len(moves),
+    )
+    for i, key in enumerate(sorted(moves)):
+        ENTRY.pack_into(data, HEADER.size + i * ENTRY.size, key, moves[key])
+    # Written next to the target and renamed over it, so a running bot never
+    # maps a half written book.
+    with open(path + ".tmp", "wb") as book_file:
+        book_file.write(data)
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,192 @@
+import asyncio
+import queue
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Type
+
+import protocol
+import utils
+from bitboard import BitBoard
+
+POOL_SIZE = 8  # idle connections a client keeps open
+REQUEST_TIMEOUT = 60.0
+MAX_BOARD_SIDE = 15  # larger boards keep the single bot thread busy too long
+
+# Bot moves computed by one long-running process, so that every game host
+# shares its opening books and warm transposition tables. Bots run one at a
+# time on a worker thread while the event loop keeps serving connections.
+# Requests for a position that is already being computed wait for that
+# computation instead of starting another one.
+#
+# Addresses are "host:port" for TCP, anything else is the path of a Unix
+# domain socket.
+#
+# Requests come from the network, so positions are checked before a bot sees
+# them and invalid ones are answered with a Close message.
+
+
+class BotService:
+    def __init__(
+        self,
+        game_type_class: Type,
+        bot_num: int,
+        report: Callable[[str], None] = print,
+    ):
+        self.game_type_class = game_type_class
+        self.bot_num = bot_num
+        self.report = report
+        self.requests = 0
+        self.computed = 0
+        self._in_flight = {}  # MoveRequest -> future of its move index
+        self._executor = ThreadPoolExecutor(1)
+
+    async def serve(self, address: str) -> None:
+        host, port = parse_address(address)
+        if port is None:
+            server = await asyncio.start_unix_server(self._handle_connection, host)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+        self.report(f"Serving bot moves on {address}.")
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                request = await protocol.read_message(reader)
+                if not isinstance(request, protocol.MoveRequest):
+                    raise protocol.ProtocolError("Expected a move request.")
+                try:
+                    move = await self.best_move(request)
+                except ValueError as error:
+                    writer.write(protocol.encode(protocol.Close(str(error))))
+                    await writer.drain()
+                    break
+                writer.write(protocol.encode(protocol.MoveReply(move)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def best_move(self, request: protocol.MoveRequest) -> int:
+        self.requests += 1
+        future = self._in_flight.get(request)
+        if future is None:
+            self.computed += 1
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._compute_move, request
+            )
+            self._in_flight[request] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(request, None))
+        return await asyncio.shield(future)
+
+    def _compute_move(self, request: protocol.MoveRequest) -> int:
+        # Bot type 0 is a human player.
+        if not 0 < request.bot_type < self.bot_num:
+            raise ValueError(f"There is no bot of type {request.bot_type}.")
+        check_position(request)
+        bit_board = BitBoard(
+            request.width, request.height, request.win_length, request.masks
+        )
+        if bit_board.is_winning() or bit_board.is_draw():
+            raise ValueError("The game is already over.")
+        players = (
+            utils.Player("x", bot_type=request.bot_type),
+            utils.Player("o", bot_type=request.bot_type),
+        )
+        game = self.game_type_class(
+            None,
+            bit_board,
+            players[request.player],
+            *players,
+            win_length=request.win_length,
+        )
+        return game.encode_move(game.generate_move_from_current_player())
+
+
+class BotClient:
+    # Asks a bot service for moves, from any number of threads. Connections
+    # are taken from a pool of idle ones, or opened when there is none.
+    def __init__(self, address: str, pool_size: int = POOL_SIZE):
+        self.address = address
+        self._idle = queue.LifoQueue(pool_size)
+
+    def best_move(
+        self,
+        width: int,
+        height: int,
+        win_length: int,
+        masks: tuple[int, int],
+        player: int,
+        bot_type: int,
+    ) -> int:
+        connection = self._acquire()
+        try:
+            connection.send(
+                protocol.MoveRequest(
+                    width, height, win_length, tuple(masks), player, bot_type
+                )
+            )
+            reply = connection.receive()
+        except BaseException:
+            connection.close()
+            raise
+        if isinstance(reply, protocol.Close):
+            connection.close()
+            raise ValueError(reply.reason)
+        self._release(connection)
+        return reply.index
+
+    def close(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+    def _acquire(self) -> protocol.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        host, port = parse_address(self.address)
+        if port is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(host)
+        else:
+            sock = socket.create_connection((host, port))
+        sock.settimeout(REQUEST_TIMEOUT)
+        return protocol.Connection(sock)
+
+    def _release(self, connection: protocol.Connection) -> None:
+        try:
+            self._idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+
+def check_position(request: protocol.MoveRequest) -> None:
+    if not (
+        0 < request.width <= MAX_BOARD_SIDE and 0 < request.height <= MAX_BOARD_SIDE
+    ):
+        raise ValueError(
+            f"Boards must be 1 to {MAX_BOARD_SIDE} cells wide and high, "
+            f"not {request.width}x{request.height}."
+        )
+    if not 0 < request.win_length <= max(request.width, request.height):
+        raise ValueError(
+            f"A win length of {request.win_length} does not fit a "
+            f"{request.width}x{request.height} board."
+        )
+    x_mask, o_mask = request.masks
+    if x_mask & o_mask or (x_mask | o_mask) >> (request.width * request.height):
+        raise ValueError("The marks overlap or lie outside the board.")
+    if request.player not in (0, 1):
+        raise ValueError(f"There is no player {request.player}.")
+
+
+def parse_address(address: str) -> tuple[str, int | None]:
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address, None
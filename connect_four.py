@@ -0,0 +1,359 @@
+import random
+import socket
+from functools import cache, cached_property
+
+import utils
+import protocol
+import randomness
+import search
+from bitboard import MARKS, MaskBoard
+
+WIDTH, HEIGHT, WIN_LENGTH = 7, 6, 4
+ALPHA_BETA_BOT_TYPE = 2
+
+# Connect Four on bitboards. Every column takes height + 1 bits, bottom cell
+# first, and the spare bit on top of each column is never set, so shifting a
+# mask by one column (or one column and a row, for the diagonals) can never
+# carry a line over from one column into the next. A line of k is then found
+# with a few shifts and ANDs per direction, without looking at single cells.
+#
+# Moves are column numbers. Every column keeps the bit of its lowest empty
+# cell, so a drop is one OR and legal moves are the columns whose next bit is
+# still on the board. Cells are (x, y) with y == 0 the top row, like the rows
+# a board is rendered from.
+
+
+class ConnectFourGeometry:
+    def __init__(self, width: int, height: int, win_length: int):
+        if win_length > max(width, height):
+            raise ValueError(
+                f"Cannot get {win_length} in a row on a {width}x{height} board."
+            )
+        self.width = width
+        self.height = height
+        self.win_length = win_length
+        self.cell_count = width * height
+        self.stride = height + 1
+        self.bottom_bits = [1 << column * self.stride for column in range(width)]
+        self.top_bits = [bit << height for bit in self.bottom_bits]
+        self.top_mask = sum(self.top_bits)
+        self.column_masks = [bit * ((1 << height) - 1) for bit in self.bottom_bits]
+        self.full_mask = sum(self.column_masks)
+        # Vertical, horizontal and the two diagonals.
+        self.shifts = (1, self.stride, self.stride - 1, self.stride + 1)
+        self.win_lines = self._build_win_lines()
+
+    def _build_win_lines(self) -> list[int]:
+        # Lines running off the board reach a spare bit or beyond the last
+        # column, outside of the full mask.
+        win_lines = []
+        for start in _iter_bits(self.full_mask):
+            for shift in self.shifts:
+                line = 0
+                for i in range(self.win_length):
+                    line |= start << shift * i
+                if line & self.full_mask == line:
+                    win_lines.append(line)
+        return win_lines
+
+    @cached_property
+    def symmetries(self) -> list[list[int]]:
+        # Column permutations mapping the board onto itself: the identity and
+        # the mirror image, gravity rules out the others.
+        columns = list(range(self.width))
+        return [columns, columns[::-1]]
+
+    @cached_property
+    def inverse_symmetries(self) -> list[list[int]]:
+        # Both symmetries are their own inverse.
+        return self.symmetries
+
+    @cached_property
+    def centre_distances(self) -> list[int]:
+        # Doubled distance of each column from the centre of the board.
+        return [abs(2 * column - self.width + 1) for column in range(self.width)]
+
+    @cached_property
+    def symmetric_zobrist_keys(self) -> list[dict[int, tuple[int, int]]]:
+        # Per player, the keys of a cell bit and of its mirror image. Seeded by
+        # the board shape so hashes are stable across runs.
+        rng = random.Random(
+            f"connect four {self.width}x{self.height}x{self.win_length}"
+        )
+        keys = [
+            {bit: rng.getrandbits(64) for bit in _iter_bits(self.full_mask)}
+            for _ in MARKS
+        ]
+        return [
+            {
+                bit: (player_keys[bit], player_keys[self.mirror_bit(bit)])
+                for bit in player_keys
+            }
+            for player_keys in keys
+        ]
+
+    @cached_property
+    def side_key(self) -> int:
+        return random.Random(
+            f"connect four {self.width}x{self.height}x{self.win_length} side"
+        ).getrandbits(64)
+
+    def cell_bit(self, move: tuple[int, int]) -> int:
+        x, y = move
+        return 1 << x * self.stride + self.height - 1 - y
+
+    def mirror_bit(self, bit: int) -> int:
+        index = bit.bit_length() - 1
+        column, row = divmod(index, self.stride)
+        return 1 << (self.width - 1 - column) * self.stride + row
+
+    def is_on_board(self, move: tuple[int, int]) -> bool:
+        return 0 <= move[0] < self.width and 0 <= move[1] < self.height
+
+    def has_line(self, bits: int) -> bool:
+        # A bit stays set in `runs` while the `length` cells from it on are
+        # all set, doubling the length each step and then topping it up.
+        win_length = self.win_length
+        for shift in self.shifts:
+            runs, length = bits, 1
+            while 2 * length <= win_length:
+                runs &= runs >> shift * length
+                length *= 2
+            if length < win_length:
+                runs &= runs >> shift * (win_length - length)
+            if runs:
+                return True
+        return False
+
+
+@cache
+def get_geometry(width: int, height: int, win_length: int) -> ConnectFourGeometry:
+    return ConnectFourGeometry(width, height, win_length)
+
+
+def _iter_bits(bits: int):
+    while bits:
+        lowest = bits & -bits
+        yield lowest
+        bits ^= lowest
+
+
+class ConnectFourBoard(MaskBoard):
+    def __init__(
+        self,
+        width: int = WIDTH,
+        height: int = HEIGHT,
+        win_length: int = WIN_LENGTH,
+        masks: tuple[int, int] = (0, 0),
+    ):
+        self.geometry = geometry = get_geometry(width, height, win_length)
+        self.masks = list(masks)
+        occupied = masks[0] | masks[1]
+        # Per column, the bit of the lowest empty cell.
+        self.heights = [
+            bottom << (occupied & column_mask).bit_count()
+            for bottom, column_mask in zip(geometry.bottom_bits, geometry.column_masks)
+        ]
+        if any(
+            occupied & column_mask & ~(height_bit - 1)
+            for height_bit, column_mask in zip(self.heights, geometry.column_masks)
+        ):
+            raise ValueError("Marks cannot float above empty cells.")
+        # (player index, column) per move, newest last, for unmake_move and
+        # for checking only the last mover's mask in is_winning.
+        self.history = []
+        # Zobrist hash of the position and of its mirror image.
+        self.hashes = [0, 0]
+        for player, mask in enumerate(self.masks):
+            for bit in _iter_bits(mask):
+                self._toggle_hashes(player, bit)
+
+    @classmethod
+    def from_rows(
+        cls, rows: tuple[tuple[str | None]], win_length: int = WIN_LENGTH
+    ) -> "ConnectFourBoard":
+        width, height = len(rows[0]), len(rows)
+        geometry = get_geometry(width, height, win_length)
+        masks = [0, 0]
+        for y, row in enumerate(rows):
+            for x, mark in enumerate(row):
+                if mark:
+                    masks[MARKS.index(mark)] |= geometry.cell_bit((x, y))
+        return cls(width, height, win_length, tuple(masks))
+
+    def _toggle_hashes(self, player: int, bit: int) -> None:
+        key, mirrored_key = self.geometry.symmetric_zobrist_keys[player][bit]
+        hashes = self.hashes
+        hashes[0] ^= key
+        hashes[1] ^= mirrored_key
+
+    def make_index_move(self, column: int, player: int) -> None:
+        heights = self.heights
+        bit = heights[column]
+        heights[column] = bit << 1
+        self.masks[player] |= bit
+        self.history.append((player, column))
+        self._toggle_hashes(player, bit)
+
+    def unmake_move(self) -> None:
+        player, column = self.history.pop()
+        heights = self.heights
+        bit = heights[column] >> 1
+        heights[column] = bit
+        self.masks[player] ^= bit
+        self._toggle_hashes(player, bit)
+
+    def find_winner(self) -> str | None:
+        if self.history:
+            player = self.history[-1][0]
+            if self.geometry.has_line(self.masks[player]):
+                return MARKS[player]
+            return None
+        # Boards set up without a move history (e.g. from rows) need both.
+        for mark, mask in zip(MARKS, self.masks):
+            if self.geometry.has_line(mask):
+                return mark
+        return None
+
+    def get_legal_indices(self) -> list[int]:
+        top_mask = self.geometry.top_mask
+        return [
+            column for column, bit in enumerate(self.heights) if not bit & top_mask
+        ]
+
+    def get_legal_moves(self) -> list[int]:
+        return self.get_legal_indices()
+
+
+searcher = search.Searcher()
+
+
+class ConnectFourGame(utils.Game):
+    def __init__(
+        self,
+        terminal_screen: utils.TerminalScreen,
+        board: list[list[str | None]],
+        current_player: utils.Player,
+        player_a: utils.Player,
+        player_b: utils.Player,
+        win_length: int = None,
+    ):
+        utils.Game.__init__(
+            self,
+            terminal_screen,
+            board,
+            current_player,
+            player_a,
+            player_b,
+            win_length if win_length else WIN_LENGTH,
+        )
+        self.generating_moves_funcs = [
+            self.get_move,
+            self.generate_random_move_bot,
+            self.alpha_beta_bot,
+        ]
+
+    @classmethod
+    def board_shape(
+        cls, board_size: int | tuple[int, int], win_length: int | None
+    ) -> tuple[int, int, int]:
+        # A single board size is the width, and the board a row less high: 7x6,
+        # 8x7...
+        width, height = (
+            board_size
+            if isinstance(board_size, tuple)
+            else (board_size, board_size - 1)
+        )
+        return width, height, win_length if win_length else WIN_LENGTH
+
+    @property
+    def board(self) -> tuple[tuple[str | None]]:
+        return self.bit_board.to_rows()
+
+    @board.setter
+    def board(self, board: tuple[tuple[str | None]] | ConnectFourBoard) -> None:
+        self.bit_board = (
+            board.copy()
+            if isinstance(board, ConnectFourBoard)
+            else ConnectFourBoard.from_rows(board, self.win_length)
+        )
+
+    def is_winning(self) -> bool:
+        return self.bit_board.is_winning()
+
+    def is_draw(self) -> bool:
+        return self.bit_board.is_draw()
+
+    def get_legal_moves(self) -> list[int]:
+        return self.bit_board.get_legal_moves()
+
+    def make_move(self, move: int) -> None:
+        self.bit_board.make_index_move(
+            move, 0 if self.is_maximizing_players_turn else 1
+        )
+
+    def encode_move(self, move: int) -> int:
+        return move
+
+    def decode_move(self, encoded_move: int) -> int:
+        return encoded_move
+
+    def state_hash(self) -> int:
+        return self.bit_board.position_key(self.is_maximizing_players_turn)
+
+    def get_move(self) -> int:
+        move = None
+        legal_moves = self.get_legal_moves()
+        while move == None or move not in legal_moves:
+            if move != None:
+                self.terminal_screen.show_info_message(
+                    "That column is full or off the board, please pick another one."
+                )
+            try:
+                ascii_input = self.terminal_screen.get_ascii_input(
+                    f'Which column does "{self.current_player.mark}" drop into?'
+                    f" Range is 0~{self.bit_board.geometry.width - 1}."
+                )
+                move = int(ascii_input)
+            except ValueError:
+                self.terminal_screen.show_info_message(
+                    "Wrong format. Please input a column number."
+                )
+                continue
+        return move
+
+    def generate_random_move_bot(self) -> int:
+        return randomness.random_choice(self.get_legal_moves())
+
+    def alpha_beta_bot(self) -> int:
+        move, _, _ = searcher.search(
+            self.bit_board, 0 if self.is_maximizing_players_turn else 1
+        )
+        return move
+
+    def start_pondering(self, bot_type: int) -> search.Ponderer | None:
+        # Only the alpha-beta bot keeps tables that searching ahead can fill.
+        if bot_type != ALPHA_BETA_BOT_TYPE:
+            return None
+        ponderer = search.Ponderer(searcher)
+        ponderer.start(self.bit_board, 0 if self.is_maximizing_players_turn else 1)
+        return ponderer
+
+
+class OnlineConnectFourGame(ConnectFourGame, utils.OnlineGame):
+    def __init__(
+        self,
+        terminal_screen: utils.TerminalScreen,
+        board: list[list[str | None]],
+        current_player: utils.Player,
+        player_a: utils.Player,
+        player_b: utils.Player,
+        connection: protocol.Connection,
+        playing_as_host: bool,
+        _waiting_sock: socket.socket = None,
+        win_length: int = None,
+    ):
+        ConnectFourGame.__init__(
+            self, terminal_screen, board, current_player, player_a, player_b, win_length
+        )
+        utils.OnlineGame.__init__(self, connection, playing_as_host, _waiting_sock)
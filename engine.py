@@ -0,0 +1,251 @@
+from collections import deque
+from typing import Iterable, Iterator, NamedTuple, Sequence
+
+import book
+import search
+from bitboard import BitBoard, BoardGeometry
+
+ALPHA_BETA, MONTE_CARLO = "alpha_beta", "monte_carlo"
+ALGORITHMS = (ALPHA_BETA, MONTE_CARLO)
+CHUNK_POSITIONS = 16  # positions sent to a worker at a time
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# The game without its screen or its network: positions, legal moves, searches
+# and batches of searches, for scripts and services to import. Positions are
+# BitBoards and moves (x, y) cells, "x" moves first and the side to move
+# follows from the marks on the board. Importing this loads neither curses nor
+# sockets: the process pool and the Monte Carlo search (which needs NumPy) are
+# only imported when first used.
+
+
+class SearchResult(NamedTuple):
+    move: tuple[int, int] | None  # None once the game is over
+    # For the side to move: search.WIN_SCORE based for alpha-beta, the win
+    # rate in [0, 1] for Monte Carlo. Always the search's, a book move is only
+    # searched first.
+    score: float
+    # Fully searched depth for alpha-beta, iterations run for Monte Carlo.
+    depth: int
+    nodes: int
+
+
+def new_position(
+    width: int,
+    height: int = None,
+    win_length: int = None,
+    moves: Iterable[tuple[int, int]] = (),
+) -> BitBoard:
+    position = BitBoard(width, height, win_length)
+    for move in moves:
+        position = play(position, move)
+    return position
+
+
+def position_from_rows(
+    rows: Sequence[Sequence[str | None]], win_length: int = None
+) -> BitBoard:
+    return BitBoard.from_rows(tuple(tuple(row) for row in rows), win_length)
+
+
+def side_to_move(position: BitBoard) -> int:
+    # 0 for "x", 1 for "o".
+    return position.side_to_move()
+
+
+def is_over(position: BitBoard) -> bool:
+    return position.find_winner() is not None or position.is_draw()
+
+
+def winner(position: BitBoard) -> str | None:
+    return position.find_winner()
+
+
+def legal_moves(position: BitBoard) -> list[tuple[int, int]]:
+    return [] if is_over(position) else position.get_legal_moves()
+
+
+def play(position: BitBoard, move: tuple[int, int]) -> BitBoard:
+    # The position after the move, the given one is left as it was.
+    geometry = position.geometry
+    if not geometry.is_on_board(move) or position.get_mark(move):
+        raise ValueError(f"{move} is not an empty cell.")
+    if is_over(position):
+        raise ValueError("The game is already over.")
+    after = position.copy()
+    after.make_index_move(geometry.cell_index(move), side_to_move(position))
+    return after
+
+
+class Engine:
+    # Keeps its searchers between calls, so that their transposition table,
+    # history scores and Monte Carlo tree carry over from one position to the
+    # next. A limit of None means none; alpha-beta stops at the end of the
+    # game anyway, Monte Carlo needs a time limit or iterations. With
+    # use_book, a book move is searched first by alpha-beta, so that it is
+    # played when the time is too short for the search to finish a depth;
+    # the score and the depth are still the search's.
+    def __init__(
+        self,
+        algorithm: str = ALPHA_BETA,
+        time_limit: float | None = search.DEFAULT_TIME_LIMIT,
+        max_depth: int = None,
+        iterations: int = None,
+        use_book: bool = True,
+    ):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown algorithm {algorithm!r}.")
+        if algorithm == MONTE_CARLO and time_limit is None and iterations is None:
+            raise ValueError("Monte Carlo search needs a time limit or iterations.")
+        self.algorithm = algorithm
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.iterations = iterations
+        self.use_book = use_book
+        self.searcher = search.Searcher(time_limit, max_depth)
+        self._monte_carlo_searcher = None
+        self._opening_books = {}  # geometry -> OpeningBook, or None
+        self._executor = None
+        self._executor_workers = 0
+
+    def search(self, position: BitBoard) -> SearchResult:
+        player = side_to_move(position)
+        if position.find_winner() is not None:
+            return SearchResult(None, self._lost_score(), 0, 0)
+        if position.is_draw():
+            return SearchResult(None, self._drawn_score(), 0, 0)
+        geometry = position.geometry
+        board = position.copy()
+        if self.algorithm == MONTE_CARLO:
+            searcher = self._get_monte_carlo_searcher()
+            searcher.time_limit = self.time_limit
+            searcher.iterations = self.iterations
+            move, score, iterations = searcher.search(board, player)
+            return SearchResult(geometry.index_to_move(move), score, iterations, 0)
+        book_move = None
+        if self.use_book:
+            opening_book = self._get_opening_book(geometry)
+            book_move = opening_book and opening_book.get_move(board, player == 0)
+        self.searcher.time_limit = self.time_limit
+        self.searcher.max_depth = self.max_depth
+        move, score, depth = self.searcher.search(board, player, first_move=book_move)
+        return SearchResult(
+            geometry.index_to_move(move), score, depth, self.searcher.stats.nodes
+        )
+
+    def search_many(
+        self, positions: Iterable[BitBoard], workers: int = 1
+    ) -> list[SearchResult]:
+        return list(self.iter_search(positions, workers))
+
+    def iter_search(
+        self,
+        positions: Iterable[BitBoard],
+        workers: int = 1,
+        chunk_size: int = CHUNK_POSITIONS,
+    ) -> Iterator[SearchResult]:
+        # Results in the order of the positions, as they become available.
+        # Positions are read ahead only as far as the busy workers need, so
+        # neither side of an endless stream is held in memory. With several
+        # workers every one of them keeps its own engine, and with it its own
+        # tables, between positions and calls.
+        if workers <= 1:
+            for position in positions:
+                yield self.search(position)
+            return
+        executor = self._get_executor(workers)
+        settings = (
+            self.algorithm,
+            self.time_limit,
+            self.max_depth,
+            self.iterations,
+            self.use_book,
+        )
+        chunks = _chunks(positions, chunk_size)
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(_search_positions, chunk, settings))
+            if len(pending) >= CHUNKS_IN_FLIGHT_PER_WORKER * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._monte_carlo_searcher is not None:
+            self._monte_carlo_searcher.close()
+        for opening_book in self._opening_books.values():
+            if opening_book is not None:
+                opening_book.close()
+        self._opening_books.clear()
+
+    def _lost_score(self) -> float:
+        return 0.0 if self.algorithm == MONTE_CARLO else -search.WIN_SCORE
+
+    def _drawn_score(self) -> float:
+        return 0.5 if self.algorithm == MONTE_CARLO else 0
+
+    def _get_opening_book(self, geometry: BoardGeometry) -> book.OpeningBook | None:
+        if geometry not in self._opening_books:
+            self._opening_books[geometry] = book.load_book(geometry)
+        return self._opening_books[geometry]
+
+    def _get_monte_carlo_searcher(self):
+        if self._monte_carlo_searcher is None:
+            import mcts
+
+            self._monte_carlo_searcher = mcts.MonteCarloSearcher()
+        return self._monte_carlo_searcher
+
+    def _get_executor(self, workers: int):
+        from concurrent.futures import ProcessPoolExecutor
+
+        if self._executor is not None and self._executor_workers != workers:
+            self._executor.shutdown()
+            self._executor = None
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(workers)
+            self._executor_workers = workers
+        return self._executor
+
+
+_worker_engine = None  # per worker process, keeps its tables between positions
+
+
+def _chunks(
+    positions: Iterable[BitBoard], chunk_size: int
+) -> Iterator[list[tuple[int, int, int, tuple[int, int]]]]:
+    # The positions as lists of picklable (width, height, win_length, masks).
+    chunk = []
+    for position in positions:
+        geometry = position.geometry
+        chunk.append(
+            (
+                geometry.width,
+                geometry.height,
+                geometry.win_length,
+                tuple(position.masks),
+            )
+        )
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _search_positions(
+    boards: list[tuple[int, int, int, tuple[int, int]]], settings: tuple
+) -> list[SearchResult]:
+    global _worker_engine
+    if _worker_engine is None:
+        _worker_engine = Engine(*settings)
+    (
+        _worker_engine.algorithm,
+        _worker_engine.time_limit,
+        _worker_engine.max_depth,
+        _worker_engine.iterations,
+        _worker_engine.use_book,
+    ) = settings
+    return [_worker_engine.search(BitBoard(*board)) for board in boards]
@@ -0,0 +1,136 @@
+import os
+import struct
+from time import sleep
+from typing import Callable, Iterator, NamedTuple
+
+import protocol
+import utils
+from bitboard import MARKS, BitBoard
+
+MAGIC = b"abs2mn games\x01"  # starts every log, the last byte is the version
+MOVE_INTERVAL = 1.0  # seconds between two moves of a replay at speed 1
+DRAW, X_WIN, O_WIN, ABANDONED = 0, 1, 2, 3  # outcomes, like utils.play_bots
+
+# Finished games appended to a binary file: after the magic bytes every game
+# is its board shape, its outcome and its move count, then the moves as
+# 16-bit cell indices, all big-endian.
+RECORD_HEADER = struct.Struct("!HHHBH")
+MOVE = struct.Struct("!H")
+
+
+class GameRecord(NamedTuple):
+    width: int
+    height: int
+    win_length: int
+    outcome: int
+    moves: list[int]
+
+
+class GameLog:
+    def __init__(self, path: str):
+        self.path = path
+        is_new = not os.path.exists(path) or not os.path.getsize(path)
+        self._file = open(path, "ab")
+        if is_new:
+            self._file.write(MAGIC)
+            self._file.flush()
+
+    def append(self, record: GameRecord) -> None:
+        self._file.write(
+            RECORD_HEADER.pack(
+                record.width,
+                record.height,
+                record.win_length,
+                record.outcome,
+                len(record.moves),
+            )
+            + struct.pack(f"!{len(record.moves)}H", *record.moves)
+        )
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_games(path: str) -> Iterator[GameRecord]:
+    with open(path, "rb") as log_file:
+        if log_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a game log.")
+        while header := log_file.read(RECORD_HEADER.size):
+            if len(header) < RECORD_HEADER.size:
+                raise ValueError(f"{path} ends in the middle of a game.")
+            width, height, win_length, outcome, move_count = RECORD_HEADER.unpack(
+                header
+            )
+            moves = log_file.read(move_count * MOVE.size)
+            if len(moves) < move_count * MOVE.size:
+                raise ValueError(f"{path} ends in the middle of a game.")
+            yield GameRecord(
+                width,
+                height,
+                win_length,
+                outcome,
+                list(struct.unpack(f"!{move_count}H", moves)),
+            )
+
+
+def replay_games(
+    path: str, speed: float = 1.0, show: Callable[[str], None] = print
+) -> None:
+    # Shows every position of every logged game, speed 0 shows them at once.
+    interval = MOVE_INTERVAL / speed if speed else 0
+    for game_number, record in enumerate(read_games(path), 1):
+        show(
+            f"Game {game_number}: {record.win_length} in a row on a"
+            f" {record.width}x{record.height} board."
+        )
+        bit_board = BitBoard(record.width, record.height, record.win_length)
+        for ply, index in enumerate(record.moves):
+            bit_board.make_index_move(index, ply % 2)
+            sleep(interval)
+            show(format_board(bit_board))
+        show(describe_outcome(record.outcome))
+
+
+def watch_match(
+    host_name: str,
+    port: int,
+    match_number: int = 0,
+    show: Callable[[str], None] = print,
+) -> None:
+    # Follows a match on a match server's spectator port until it ends.
+    connection = protocol.Connection(utils.connect_to_host(host_name, port))
+    try:
+        connection.send(protocol.Watch(match_number))
+        hello = connection.receive()
+        if isinstance(hello, protocol.Close):
+            show(hello.reason)
+            return
+        bit_board = BitBoard(hello.width, hello.height, hello.win_length)
+        player = hello.first_player
+        while True:
+            message = connection.receive()
+            if isinstance(message, protocol.Close):
+                show(message.reason)
+                return
+            bit_board.make_index_move(message.index, player)
+            if bit_board.position_key(player == 0) != message.state_hash:
+                raise protocol.ProtocolError("The spectated board differs.")
+            show(format_board(bit_board))
+            player = 1 - player
+    finally:
+        connection.close()
+
+
+def format_board(bit_board: BitBoard) -> str:
+    # Ends with an empty line, to keep boards shown one after another apart.
+    return "".join(
+        " ".join(mark if mark else "." for mark in row) + "\n"
+        for row in bit_board.to_rows()
+    )
+
+
+def describe_outcome(outcome: int) -> str:
+    if outcome in (X_WIN, O_WIN):
+        return f'"{MARKS[outcome - 1]}" won.'
+    return "Draw." if outcome == DRAW else "Abandoned."
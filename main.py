@@ -1,40 +1,123 @@
 import curses
 import argparse
+import asyncio
+import os
 import sys
-from time import sleep
 
 import utils
+import analysis
+import benchmark
+import book
+import bot_service
+import connect_four
+import engine
+import gamelog
+import proof
+import randomness
+import search
+import server
+import solver
+import tictactoe
+import tournament
+from bitboard import BitBoard, get_geometry
+from connect_four import ConnectFourGame, OnlineConnectFourGame
+from sparseboard import SparseBoard
 from tictactoe import TicTacToeGame, OnlineTicTacToeGame
 
 REPEAT_TIMES = 10000
-GAMEEND_TIMEOUT = 1000
-BOT_NUM = BOARD_SIZE = 3
-INFO_LINE_NUM_START = BOARD_SIZE + 4
+BOT_NUM = 5
+BOARD_SIZE = 3
+INFO_LINES_BELOW_BOARD = 4  # the info zone starts this many lines after the rows
+# Per game: its class, its online class, its board size and its number of bot
+# types (human included). The server, the bot service, the analysis and the
+# pre-calculation only know tic-tac-toe.
+GAMES = {
+    "tictactoe": (TicTacToeGame, OnlineTicTacToeGame, BOARD_SIZE, BOT_NUM),
+    "connect_four": (ConnectFourGame, OnlineConnectFourGame, connect_four.WIDTH, 3),
+}
 
 
 # Do I need a separate class for move?
-def do_pre_calculations() -> None:
-    def calculate_and_cache_for_state(
-        board: list[list[str | None]], is_maximizing_players_turn
-    ) -> None:
-        player_a = utils.Player("x", bot_type=2)
-        player_b = utils.Player("o", bot_type=2)
-        game = TicTacToeGame(
-            None,
-            board,
-            player_a if is_maximizing_players_turn else player_b,
-            player_a,
-            player_b,
-        )
-        game.minimax_pruning_with_cache_bot()
-        for valid_move in game.get_legal_moves():
-            game.board = board  # reset board set by previous move
-            game.make_move(valid_move)
-            if game.is_winning() or game.is_draw():
-                continue
-            calculate_and_cache_for_state(game.board, not is_maximizing_players_turn)
+def do_pre_calculations(win_length: int = None, workers: int = 1) -> None:
+    geometry = BitBoard(BOARD_SIZE, win_length=win_length).geometry
+    book_moves = solver.solve_parallel(geometry, workers)
+    book_path = book.get_book_path(geometry)
+    book.write_book(book_path, geometry, book_moves)
+    print(f"Wrote {len(book_moves)} positions to {book_path}.")
+
+
+def do_proof(
+    board_size: int | tuple[int, int],
+    win_length: int = None,
+    max_nodes: int = None,
+    checkpoint_path: str = None,
+) -> None:
+    # Proves the empty board and adds the moves of the proof to the opening
+    # book, where the book already has a move it is kept.
+    width, height, win_length = TicTacToeGame.board_shape(board_size, win_length)
+    geometry = get_geometry(width, height, win_length)
+    board = SparseBoard(width, height, win_length)
+    prover = proof.Prover(geometry, max_nodes, checkpoint_path=checkpoint_path)
+    result = prover.prove(board)
+    shape = f"{width}x{height} with {win_length} in a row"
+    if result == proof.UNKNOWN:
+        print(f"Not proved after {prover.nodes} nodes on {shape}.")
+        return
+    outcome = {proof.WIN: "x wins", proof.LOSS: "o wins", proof.DRAW: "It's a draw"}
+    print(f"{outcome[result]} on {shape}, proved in {prover.nodes} nodes.")
+    if result == proof.DRAW:
+        return
+    book_moves = prover.proof_moves(board)
+    opening_book = book.load_book(geometry)
+    if opening_book is not None:
+        book_moves.update(opening_book.items())
+        opening_book.close()
+    book_path = book.get_book_path(geometry)
+    book.write_book(book_path, geometry, book_moves)
+    print(f"Wrote {len(book_moves)} positions to {book_path}.")
+
 
-    calculate_and_cache_for_state(utils.create_board(BOARD_SIZE), True)
+def configure_bots(
+    time_limit: float,
+    iterations: int | None,
+    mcts_workers: int,
+    rng_type: str,
+    seed: int | None,
+    remote_bots: str | None,
+    stats_path: str | None,
+) -> None:
+    # Also run in every tournament worker, which may not have forked from us
+    # (or may have, and inherited our hooks).
+    randomness.use_rng(rng_type, seed)
+    search.search_hooks[:] = [search.StatsLog(stats_path)] if stats_path else []
+    if remote_bots:
+        tictactoe.bot_client = bot_service.BotClient(remote_bots)
+    tictactoe.searcher.time_limit = time_limit
+    connect_four.searcher.time_limit = time_limit
+    monte_carlo_searcher = tictactoe.monte_carlo_searcher
+    monte_carlo_searcher.time_limit = time_limit if iterations is None else None
+    monte_carlo_searcher.iterations = iterations
+    monte_carlo_searcher.workers = mcts_workers
+
+
+def parse_board_size(text: str) -> int | tuple[int, int]:
+    try:
+        sides = tuple(int(side) for side in text.lower().split("x"))
+    except ValueError:
+        sides = ()
+    if len(sides) not in (1, 2) or min(sides) < 1:
+        raise argparse.ArgumentTypeError(f"{text!r} is not a board size")
+    return sides[0] if len(sides) == 1 else sides
+
+
+def parse_win_length(text: str) -> int:
+    try:
+        win_length = int(text)
+    except ValueError:
+        win_length = 0
+    if win_length < 1:
+        raise argparse.ArgumentTypeError(f"{text!r} is not a positive win length")
+    return win_length
 
 
 def get_args() -> argparse.Namespace:
@@ -44,6 +127,80 @@ def get_args() -> argparse.Namespace:
     parser.add_argument(
         "-o", "--online", action="store_true", help="play the game online"
     )
+    parser.add_argument(
+        "-g",
+        "--game",
+        choices=GAMES,
+        default="tictactoe",
+        help="game to play, compare bots at or play a round robin of",
+    )
+    parser.add_argument(
+        "--server",
+        action="store_true",
+        help="host many online matches, pairing players as they connect",
+    )
+    parser.add_argument(
+        "--host",
+        default="localhost",
+        help="address the online game or server binds or connects to",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=utils.SERVER_PORT,
+        help="port the online game or server binds or connects to",
+    )
+    parser.add_argument(
+        "--spectator_port",
+        type=int,
+        default=utils.SERVER_PORT + 1,
+        help="port the server takes spectators on and --watch connects to",
+    )
+    parser.add_argument(
+        "--game_log",
+        metavar="PATH",
+        help="append the games finished on the server to this file",
+    )
+    parser.add_argument(
+        "--watch",
+        metavar="MATCH",
+        type=int,
+        help="follow a match on the server, 0 for the latest one",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        help="show the games of a game log",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="moves per second of --replay, 0 to show them at once",
+    )
+    parser.add_argument(
+        "--bot_service",
+        metavar="ADDRESS",
+        help='compute bot moves for other processes on "host:port" or a socket path',
+    )
+    parser.add_argument(
+        "--remote_bots",
+        metavar="ADDRESS",
+        help="ask the bot service on ADDRESS for the moves of the searching bots",
+    )
+    parser.add_argument(
+        "--analyze",
+        metavar="PATH",
+        help="print the best move of every position in a file, - for stdin",
+    )
+    parser.add_argument(
+        "--benchmark",
+        metavar="NAME",
+        nargs="*",
+        choices=benchmark.BENCHMARKS,
+        help="time the engine and print the results as JSON, all benchmarks if"
+        f" none of {', '.join(benchmark.BENCHMARKS)} are named",
+    )
     parser.add_argument(
         "-c",
         "--compare_bots",
@@ -52,57 +209,251 @@ def get_args() -> argparse.Namespace:
         default=00,
         help=f"compare two bots by playing {REPEAT_TIMES} games",
     )
+    parser.add_argument(
+        "-r",
+        "--round_robin",
+        action="store_true",
+        help=f"play {REPEAT_TIMES} games between every two bots, with both marks",
+    )
     parser.add_argument(
         "-p",
         "--pre_calculation",
         action="store_true",
-        help="do the calculations for all possible board states to speed up the bot",
+        help="build the opening book of all possible board states to speed up the bot",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--prove",
+        action="store_true",
+        help="prove who wins the empty board with proof-number search and add the"
+        " proof's moves to the opening book",
+    )
+    parser.add_argument(
+        "--max_nodes",
+        type=int,
+        default=None,
+        help="node budget of --prove, the proof stops unfinished when it is spent",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        metavar="PATH",
+        help="file --prove saves its tables to and resumes from",
+    )
+    parser.add_argument(
+        "-k",
+        "--win_length",
+        type=parse_win_length,
+        default=None,
+        help="number of marks in a row needed to win, defaults to the board size",
+    )
+    parser.add_argument(
+        "-b",
+        "--board",
+        type=parse_board_size,
+        default=None,
+        help='board size as "<width>x<height>" or one number, like "15x15" for'
+        " gomoku; the game's own size by default",
+    )
+    parser.add_argument(
+        "-t",
+        "--time_limit",
+        type=float,
+        default=tictactoe.searcher.time_limit,
+        help="seconds the alpha-beta and Monte Carlo bots may think per move",
+    )
+    parser.add_argument(
+        "-i",
+        "--iterations",
+        type=int,
+        default=None,
+        help="Monte Carlo bot iterations per move, instead of a time limit",
+    )
+    parser.add_argument(
+        "-d",
+        "--max_depth",
+        type=int,
+        default=None,
+        help="depth limit of the --analyze searches, on top of the time limit",
+    )
+    parser.add_argument(
+        "--stats",
+        metavar="PATH",
+        help="append the node counts, cache hits and timings of every bot search"
+        " to this file, one JSON object per line",
+    )
+    parser.add_argument(
+        "--mcts_workers",
+        type=int,
+        default=1,
+        help="number of processes the Monte Carlo bot searches with",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of processes of the pre-calculation, analysis and bot comparisons",
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        default=None,
+        help="seed of the random number generator, for reproducible games",
+    )
+    parser.add_argument(
+        "--rng",
+        choices=randomness.RNG_TYPES,
+        default="fast",
+        help="random number generator of the bots, a secure one cannot be seeded",
+    )
+    args = parser.parse_args()
+    if args.seed is not None and args.rng == "secure":
+        parser.error("the secure random number generator cannot be seeded")
+    if args.game != "tictactoe" and (
+        args.server
+        or args.bot_service
+        or args.analyze
+        or args.pre_calculation
+        or args.prove
+    ):
+        parser.error(f"{args.game} is only for playing and comparing bots")
+    if args.board and (
+        args.server or args.bot_service or args.analyze or args.pre_calculation
+    ):
+        parser.error("other board sizes are only for playing and comparing bots")
+    if args.win_length:
+        game_class, _, board_size, _ = GAMES[args.game]
+        width, height, _ = game_class.board_shape(args.board or board_size, None)
+        if args.win_length > max(width, height):
+            parser.error(
+                f"a win length of {args.win_length} does not fit a "
+                f"{width}x{height} board"
+            )
+    return args
 
 
 def run_game(
-    window: curses.window, info_line_num_start: int, bot_num: int, board_size: int
+    window: curses.window,
+    game_class: type,
+    online_game_class: type,
+    bot_num: int,
+    board_size: int,
 ) -> None:
-    terminal_screen = utils.TerminalScreen(window, info_line_num_start)
+    _, height, _ = game_class.board_shape(board_size, args.win_length)
+    terminal_screen = utils.TerminalScreen(window, height + INFO_LINES_BELOW_BOARD)
     game = utils.initialize_game(
-        terminal_screen, args, TicTacToeGame, OnlineTicTacToeGame, bot_num, board_size
+        terminal_screen, args, game_class, online_game_class, bot_num, board_size
     )
 
-    game.render()
-    while True:
-        game.make_a_move_from_current_player()
+    try:
         game.render()
-        if game.is_winning():
-            terminal_screen.show_info_message(
-                f'Winner is "{game.current_player.mark}"!'
-            )
-            break
-        if game.is_draw():
-            terminal_screen.show_info_message("It's a draw!")
-            break
-        game.take_turn()
+        while True:
+            game.make_a_move_from_current_player()
+            game.render()
+            if game.is_winning():
+                terminal_screen.show_info_message(
+                    f'Winner is "{game.current_player.mark}"!'
+                )
+                break
+            if game.is_draw():
+                terminal_screen.show_info_message("It's a draw!")
+                break
+            game.take_turn()
+    except ConnectionError as error:
+        terminal_screen.show_info_message(str(error))
 
     game.close()  # close socket
-    sleep(GAMEEND_TIMEOUT)
+    terminal_screen.show_info_message("Press any key to exit.")
+    terminal_screen.wait_for_any_key()
 
 
 if __name__ == "__main__":
     args = get_args()
+    bot_settings = (
+        args.time_limit,
+        args.iterations,
+        args.mcts_workers,
+        args.rng,
+        args.seed,
+        args.remote_bots,
+        args.stats,
+    )
+    configure_bots(*bot_settings)
+    game_class, online_game_class, board_size, bot_num = GAMES[args.game]
+    board_size = args.board or board_size
 
-    if args.bots_type:
+    if args.server:
+        game_server = server.GameServer(
+            BOARD_SIZE,
+            args.win_length,
+            game_log=gamelog.GameLog(args.game_log) if args.game_log else None,
+        )
+        asyncio.run(game_server.serve(args.host, args.port, args.spectator_port))
+    elif args.watch is not None:
+        gamelog.watch_match(args.host, args.spectator_port, args.watch)
+    elif args.replay:
+        gamelog.replay_games(args.replay, args.speed)
+    elif args.bot_service:
+        asyncio.run(
+            bot_service.BotService(TicTacToeGame, BOT_NUM).serve(args.bot_service)
+        )
+    elif args.analyze:
+        analysis_engine = engine.Engine(
+            time_limit=args.time_limit, max_depth=args.max_depth
+        )
+        try:
+            analysis.analyze(
+                analysis.open_positions(args.analyze, args.win_length),
+                analysis_engine,
+                args.workers,
+            )
+        except (OSError, ValueError) as error:
+            # An unreadable file or a broken game log, after the positions
+            # before it were written.
+            print(f"{sys.argv[0]}: error: {error}", file=sys.stderr)
+            sys.exit(1)
+        finally:
+            analysis_engine.close()
+    elif args.benchmark is not None:
+        benchmark.run_benchmarks(
+            args.benchmark, report=lambda message: print(message, file=sys.stderr)
+        )
+    elif args.round_robin:
+        tournament.play_round_robin(
+            range(1, bot_num),
+            game_class,
+            board_size,
+            REPEAT_TIMES,
+            args.workers,
+            args.win_length,
+            args.seed,
+            initializer=configure_bots,
+            initargs=bot_settings,
+        )
+    elif args.bots_type:
         bot_type_one = args.bots_type // 10
         bot_type_two = args.bots_type % 10
-        if bot_type_one not in range(1, BOT_NUM) or bot_type_two not in range(
-            1, BOT_NUM
+        if bot_type_one not in range(1, bot_num) or bot_type_two not in range(
+            1, bot_num
         ):
             print("Wrong bot type!")
             sys.exit(1)
-        utils.repeat_games(
-            bot_type_one, bot_type_two, TicTacToeGame, BOARD_SIZE, REPEAT_TIMES
+        tournament.play_match(
+            bot_type_one,
+            bot_type_two,
+            game_class,
+            board_size,
+            REPEAT_TIMES,
+            args.workers,
+            args.win_length,
+            args.seed,
+            initializer=configure_bots,
+            initargs=bot_settings,
         )
     elif args.pre_calculation:
-        do_pre_calculations()
-        pass
+        do_pre_calculations(args.win_length, args.workers)
+    elif args.prove:
+        do_proof(board_size, args.win_length, args.max_nodes, args.checkpoint)
     else:
-        curses.wrapper(run_game, INFO_LINE_NUM_START, BOT_NUM, BOARD_SIZE)
+        curses.wrapper(run_game, game_class, online_game_class, bot_num, board_size)
@@ -0,0 +1,256 @@
+from concurrent.futures import ProcessPoolExecutor
+from math import log, sqrt
+from time import perf_counter
+
+import numpy as np
+
+import randomness
+import search
+import simulate
+from bitboard import BitBoard
+
+DEFAULT_TIME_LIMIT = 1.0
+EXPLORATION = sqrt(2)  # UCT exploration constant for results in [0, 1]
+ROLLOUTS_PER_LEAF = 32  # random playouts per new leaf, simulated in one batch
+
+
+class Node:
+    # Results are counted for the player who made the move leading here: a
+    # win counts 1, a draw 1/2. Terminal nodes keep the [draws, "x" wins,
+    # "o" wins] of one playout from them.
+    __slots__ = (
+        "move",
+        "player",
+        "children",
+        "untried",
+        "visits",
+        "wins",
+        "terminal",
+    )
+
+    def __init__(self, move: int | None, player: int, board: BitBoard):
+        self.move = move
+        self.player = player
+        self.children = {}
+        self.visits = 0
+        self.wins = 0.0
+        self.terminal = None
+        if move is not None and board.is_winning():
+            self.terminal = [0, 0, 0]
+            self.terminal[player + 1] = 1
+        elif board.is_draw():
+            self.terminal = [1, 0, 0]
+        self.untried = [] if self.terminal else board.get_legal_indices()
+        randomness.rng.shuffle(self.untried)
+
+
+# UCT over any board exposing the BitBoard interface, rolling out every new
+# leaf with a batch of random playouts. The tree of the last search is kept and
+# its subtree for the next position is reused, so the opponent's replies that
+# were already explored are not searched again.
+class MonteCarloSearcher:
+    def __init__(
+        self,
+        time_limit: float | None = DEFAULT_TIME_LIMIT,
+        iterations: int = None,
+        workers: int = 1,
+        exploration: float = EXPLORATION,
+        rollouts_per_leaf: int = ROLLOUTS_PER_LEAF,
+    ):
+        self.time_limit = time_limit
+        self.iterations = iterations
+        self.workers = workers
+        self.exploration = exploration
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self._root = None
+        self._root_masks = None
+        self._executor = None
+
+    def search(self, board, player: int) -> tuple[int, float, int]:
+        # Runs until the time limit or the iteration budget, whichever comes
+        # first. Returns the most visited move index, its win rate for player
+        # and the number of iterations run. With several workers every one of
+        # them searches its own tree and the root statistics are summed.
+        stats = search.SearchStats("monte_carlo")
+        start = perf_counter()
+        if self.workers > 1:
+            move, winrate, iterations, stats.max_ply, stats.nodes = (
+                self._search_in_parallel(board, player)
+            )
+        else:
+            root, iterations, stats.max_ply, stats.nodes = self.grow_tree(
+                board, player
+            )
+            best = max(root.children.values(), key=lambda child: child.visits)
+            move, winrate = best.move, best.wins / best.visits
+        # No depth is searched in full, so stats.depth stays 0.
+        stats.iterations = iterations
+        stats.elapsed = perf_counter() - start
+        search.report_stats(stats)
+        return move, winrate, iterations
+
+    def grow_tree(self, board, player: int) -> tuple[Node, int, int, int]:
+        # The root, the number of iterations run, the deepest ply reached and
+        # the number of tree nodes visited.
+        root = self._reuse_root(board, player)
+        generator = randomness.batch_generator()
+        deadline = (
+            perf_counter() + self.time_limit if self.time_limit is not None else None
+        )
+        iterations = max_ply = nodes = 0
+        while not iterations or (
+            (self.iterations is None or iterations < self.iterations)
+            and (deadline is None or perf_counter() < deadline)
+        ):
+            ply = self._iterate(board, root, generator)
+            max_ply = max(max_ply, ply)
+            nodes += ply + 1  # the path from the root to the leaf
+            iterations += 1
+        return root, iterations, max_ply, nodes
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _reuse_root(self, board, player: int) -> Node:
+        # The node of the current position in the last tree, found by
+        # following the moves played since, or a new root.
+        target = tuple(board.masks)
+        node, masks = self._root, list(self._root_masks or (0, 0))
+        while node is not None and tuple(masks) != target:
+            for move, child in node.children.items():
+                bit = 1 << move
+                if target[child.player] & bit and not masks[child.player] & bit:
+                    masks[child.player] |= bit
+                    node = child
+                    break
+            else:
+                node = None
+        if node is None or node.player == player or node.terminal:
+            node = Node(None, 1 - player, board)
+        self._root, self._root_masks = node, target
+        return node
+
+    def _iterate(self, board, root: Node, generator: np.random.Generator) -> int:
+        # Returns the ply of the leaf rolled out.
+        path = [root]
+        node = root
+        while not node.untried and node.children:
+            node = self._select(node)
+            board.make_index_move(node.move, node.player)
+            path.append(node)
+        if node.untried:
+            move = node.untried.pop()
+            board.make_index_move(move, 1 - node.player)
+            child = Node(move, 1 - node.player, board)
+            node.children[move] = child
+            node = child
+            path.append(node)
+
+        if node.terminal:
+            results = [count * self.rollouts_per_leaf for count in node.terminal]
+        else:
+            results = simulate.simulate_random_games(
+                board.geometry,
+                self.rollouts_per_leaf,
+                tuple(board.masks),
+                1 - node.player,
+                generator,
+            )
+        for _ in range(len(path) - 1):
+            board.unmake_move()
+        for node in path:
+            node.visits += self.rollouts_per_leaf
+            node.wins += results[node.player + 1] + results[0] / 2
+        return len(path) - 1
+
+    def _select(self, node: Node) -> Node:
+        log_visits = log(node.visits)
+        return max(
+            node.children.values(),
+            key=lambda child: child.wins / child.visits
+            + self.exploration * sqrt(log_visits / child.visits),
+        )
+
+    def _search_in_parallel(
+        self, board, player: int
+    ) -> tuple[int, float, int, int, int]:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers)
+        geometry = board.geometry
+        futures = [
+            self._executor.submit(
+                _search_part,
+                geometry.width,
+                geometry.height,
+                geometry.win_length,
+                tuple(board.masks),
+                player,
+                self.time_limit,
+                self.iterations,
+                self.exploration,
+                self.rollouts_per_leaf,
+                randomness.rng.getrandbits(64),
+            )
+            for _ in range(self.workers)
+        ]
+        statistics, iterations, max_ply, nodes = {}, 0, 0, 0
+        for future in futures:
+            part_statistics, part_iterations, part_max_ply, part_nodes = (
+                future.result()
+            )
+            iterations += part_iterations
+            max_ply = max(max_ply, part_max_ply)
+            nodes += part_nodes
+            for move, (visits, wins) in part_statistics.items():
+                total_visits, total_wins = statistics.get(move, (0, 0.0))
+                statistics[move] = total_visits + visits, total_wins + wins
+        move, (visits, wins) = max(statistics.items(), key=lambda item: item[1][0])
+        return move, wins / visits, iterations, max_ply, nodes
+
+
+_worker_searcher = None  # per worker process, keeps its tree between moves
+
+
+def _search_part(
+    width: int,
+    height: int,
+    win_length: int,
+    masks: tuple[int, int],
+    player: int,
+    time_limit: float | None,
+    iterations: int | None,
+    exploration: float,
+    rollouts_per_leaf: int,
+    seed: int,
+) -> tuple[dict[int, tuple[int, float]], int, int, int]:
+    # Worker side of root-parallel search: the visits and wins every root move
+    # gained in this call, the number of iterations run, the deepest ply
+    # reached and the number of tree nodes visited. The statistics the reused
+    # tree already had were reported by earlier calls and are left out.
+    global _worker_searcher
+    if _worker_searcher is None:
+        _worker_searcher = MonteCarloSearcher()
+    _worker_searcher.time_limit = time_limit
+    _worker_searcher.iterations = iterations
+    _worker_searcher.exploration = exploration
+    _worker_searcher.rollouts_per_leaf = rollouts_per_leaf
+    randomness.seed_rng(seed)
+    board = BitBoard(width, height, win_length, masks)
+    earlier = {
+        move: (child.visits, child.wins)
+        for move, child in _worker_searcher._reuse_root(board, player).children.items()
+    }
+    root, part_iterations, max_ply, nodes = _worker_searcher.grow_tree(board, player)
+    statistics = {}
+    for move, child in root.children.items():
+        visits, wins = earlier.get(move, (0, 0.0))
+        if child.visits > visits:
+            statistics[move] = child.visits - visits, child.wins - wins
+    return (
+        statistics,
+        part_iterations,
+        max_ply,
+        nodes,
+    )
@@ -0,0 +1,412 @@
+import os
+import struct
+from time import perf_counter
+from typing import Callable
+
+import transposition
+from bitboard import BoardGeometry
+from sparseboard import SparseBoard
+
+WIN, LOSS, DRAW, UNKNOWN = "win", "loss", "draw", "unknown"  # for the side to move
+INFINITY = (1 << 32) - 1  # proof and disproof numbers of solved positions
+EPSILON = 0.25  # child thresholds get this much slack over the second best child
+DEFAULT_PROOF_TABLE_SIZE = 1 << 21
+REPORT_NODES = 1 << 16  # nodes between progress reports
+CHECKPOINT_SECONDS = 300  # at most this long between checkpoints
+
+CHECKPOINT_MAGIC = b"ABPN"
+CHECKPOINT_VERSION = 1
+# magic, version, width, height, win length, nodes searched, table count
+CHECKPOINT_HEADER = struct.Struct("<4sHHHHQH")
+# attacker, threats only, entry count
+TABLE_HEADER = struct.Struct("<BBQ")
+# canonical position key, proof number, disproof number, work
+TABLE_ENTRY = struct.Struct("<QIIQ")
+
+# Proves who wins a position with depth-first proof-number search (df-pn):
+# every node keeps a proof number (how many leaves at least must still be
+# shown to win for the attacker) and a disproof number (the same for showing
+# it cannot), and the search always goes down the most proving path, until
+# the numbers of the subtree cross the thresholds its parent gave it.
+#
+# A run tries to prove that one player, the attacker, wins; a draw fails it.
+# The side to move wins if it is proved as the attacker, loses if the other
+# player is, and draws if both are disproved. Forced moves are not branched
+# on: a player facing a win in one only looks at stopping it, and two wins in
+# one decide the position. With threat_space, every attacker is first tried
+# with only the moves that make a line with at most two cells to go and no
+# stone of the defender on it (threat-space search). Proofs found that way
+# hold, as the defender still tries all of its moves, but its disproofs do
+# not, so the full search runs after them.
+#
+# Memory is bounded by the table size, and a node budget stops a run with
+# the tables kept: they are saved to the checkpoint, which the next Prover
+# given that path carries on from.
+
+
+class ProofTable(transposition.TranspositionTable):
+    # Entries are (key, proof, disproof, work), and the entry that took the
+    # most work to get keeps the first slot of its bucket.
+    def __init__(self, size: int = DEFAULT_PROOF_TABLE_SIZE):
+        transposition.TranspositionTable.__init__(self, size)
+
+    def __iter__(self):
+        return (slot for slot in self.slots if slot is not None)
+
+    def store(self, key: int, proof: int, disproof: int, work: int) -> None:
+        self._store_entry((key, proof, disproof, work))
+
+
+class Prover:
+    def __init__(
+        self,
+        geometry: BoardGeometry,
+        max_nodes: int = None,
+        table_size: int = DEFAULT_PROOF_TABLE_SIZE,
+        threat_space: bool = True,
+        checkpoint_path: str = None,
+        report: Callable[[str], None] = print,
+    ):
+        self.geometry = geometry
+        self.max_nodes = max_nodes  # over all runs, None for no limit
+        self.table_size = table_size
+        self.threat_space = threat_space
+        self.checkpoint_path = checkpoint_path
+        self.report = report
+        self.tables = {}  # (attacker, threats only) -> ProofTable
+        self.nodes = 0
+        # The run being searched.
+        self.attacker = 0
+        self.threats_only = False
+        self.table = None
+        self._start = perf_counter()
+        self._start_nodes = 0
+        self._last_checkpoint = perf_counter()
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.load_checkpoint()
+
+    def prove(self, board: SparseBoard) -> str:
+        # WIN, LOSS or DRAW for the side to move, UNKNOWN if the node budget
+        # ran out first.
+        self._start, self._start_nodes = perf_counter(), self.nodes
+        player = board.side_to_move()
+        try:
+            results = []
+            for attacker in (player, 1 - player):
+                proved = self._run(board, player, attacker)
+                if proved:
+                    return WIN if attacker == player else LOSS
+                results.append(proved)
+            return DRAW if results == [False, False] else UNKNOWN
+        finally:
+            if self.checkpoint_path:
+                self.save_checkpoint()
+
+    def proof_moves(self, board: SparseBoard) -> dict[int, int]:
+        # Book moves (canonical Zobrist key -> move in the canonical
+        # orientation) along the proof of a won or lost position: the winning
+        # move of every position of the winner, and of every position of the
+        # loser the move that took the proof longest to refute. Positions the
+        # table has lost are searched again within the node budget, those it
+        # does not cover are left out.
+        player = board.side_to_move()
+        for attacker in (player, 1 - player):
+            for threats_only in (True, False):
+                table = self.tables.get((attacker, threats_only))
+                entry = table and table.get(self._key(board, player))
+                if entry and entry[0] == 0:
+                    self._use_run(attacker, threats_only)
+                    book_moves = {}
+                    self._collect_moves(board.copy(), player, book_moves, set())
+                    return book_moves
+        return {}
+
+    def save_checkpoint(self) -> None:
+        geometry = self.geometry
+        data = bytearray(
+            CHECKPOINT_HEADER.pack(
+                CHECKPOINT_MAGIC,
+                CHECKPOINT_VERSION,
+                geometry.width,
+                geometry.height,
+                geometry.win_length,
+                self.nodes,
+                len(self.tables),
+            )
+        )
+        for (attacker, threats_only), table in self.tables.items():
+            entries = list(table)
+            data += TABLE_HEADER.pack(attacker, threats_only, len(entries))
+            for entry in entries:
+                data += TABLE_ENTRY.pack(*entry)
+        # Written next to the target and renamed over it, so that stopping
+        # halfway leaves the last checkpoint whole.
+        with open(self.checkpoint_path + ".tmp", "wb") as checkpoint_file:
+            checkpoint_file.write(data)
+        os.replace(self.checkpoint_path + ".tmp", self.checkpoint_path)
+        self._last_checkpoint = perf_counter()
+
+    def load_checkpoint(self) -> None:
+        path = self.checkpoint_path
+        with open(path, "rb") as checkpoint_file:
+            data = checkpoint_file.read()
+        try:
+            magic, version, width, height, win_length, self.nodes, table_count = (
+                CHECKPOINT_HEADER.unpack_from(data)
+            )
+        except struct.error:
+            raise ValueError(f"{path} is not a proof checkpoint.")
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+            raise ValueError(f"{path} is not a version {CHECKPOINT_VERSION} proof.")
+        geometry = self.geometry
+        if (width, height, win_length) != (
+            geometry.width,
+            geometry.height,
+            geometry.win_length,
+        ):
+            raise ValueError(
+                f"{path} is a proof for {width}x{height} boards with"
+                f" {win_length} in a row."
+            )
+        offset = CHECKPOINT_HEADER.size
+        try:
+            for _ in range(table_count):
+                attacker, threats_only, entry_count = TABLE_HEADER.unpack_from(
+                    data, offset
+                )
+                offset += TABLE_HEADER.size
+                table = self._get_table(attacker, bool(threats_only))
+                for entry in TABLE_ENTRY.iter_unpack(
+                    data[offset : offset + entry_count * TABLE_ENTRY.size]
+                ):
+                    table.store(*entry)
+                offset += entry_count * TABLE_ENTRY.size
+        except struct.error:
+            raise ValueError(f"{path} is truncated.")
+        if offset != len(data):
+            raise ValueError(f"{path} is truncated.")
+        self.report(f"Resumed from {path} after {self.nodes} nodes.")
+
+    def _run(self, board: SparseBoard, player: int, attacker: int) -> bool | None:
+        # Whether attacker wins, None if it is not known.
+        for threats_only in (True, False) if self.threat_space else (False,):
+            self._use_run(attacker, threats_only)
+            self.report(
+                f"Proving that {'xo'[attacker]} wins"
+                f"{' by threats' if threats_only else ''}."
+            )
+            proof, disproof = self._search(board, player, INFINITY, INFINITY)
+            if proof == 0:
+                return True
+            if disproof != 0:
+                return None
+            if not threats_only:
+                return False
+        return False
+
+    def _use_run(self, attacker: int, threats_only: bool) -> None:
+        self.attacker = attacker
+        self.threats_only = threats_only
+        self.table = self._get_table(attacker, threats_only)
+
+    def _get_table(self, attacker: int, threats_only: bool) -> ProofTable:
+        if (attacker, threats_only) not in self.tables:
+            self.tables[(attacker, threats_only)] = ProofTable(self.table_size)
+        return self.tables[(attacker, threats_only)]
+
+    def _key(self, board: SparseBoard, player: int) -> int:
+        return board.canonical_key(player == 0)
+
+    def _search(
+        self,
+        board: SparseBoard,
+        player: int,
+        proof_threshold: int,
+        disproof_threshold: int,
+    ) -> tuple[int, int]:
+        # Searches below the position until its proof or disproof number
+        # reaches its threshold, and returns and stores both.
+        self.nodes += 1
+        if self.nodes % REPORT_NODES == 0:
+            self._report_progress()
+        key = self._key(board, player)
+        proof, disproof, moves = self._expand(board, player)
+        if not moves:
+            self.table.store(key, proof, disproof, 1)
+            return proof, disproof
+        is_attacker = player == self.attacker
+        # Each child's number that the node takes the minimum of, and the one
+        # it sums. They are read from the table once and then taken from the
+        # children's searches, so that two children evicting each other from
+        # a bucket do not send the search back into them over and over.
+        minimums, sums = [], []
+        for move in moves:
+            board.make_index_move(move, player)
+            entry = self.table.get(self._key(board, 1 - player))
+            board.unmake_move()
+            child_proof, child_disproof = entry[:2] if entry else (1, 1)
+            minimums.append(child_proof if is_attacker else child_disproof)
+            sums.append(child_disproof if is_attacker else child_proof)
+        start_nodes = self.nodes
+        while True:
+            best = min(range(len(moves)), key=minimums.__getitem__)
+            smallest = minimums[best]
+            total = min(sum(sums), INFINITY)
+            proof, disproof = (smallest, total) if is_attacker else (total, smallest)
+            if (
+                proof >= proof_threshold
+                or disproof >= disproof_threshold
+                or self._out_of_budget()
+            ):
+                break
+            second = min(minimums[:best] + minimums[best + 1 :], default=INFINITY)
+            minimum_threshold, sum_threshold = (
+                (proof_threshold, disproof_threshold)
+                if is_attacker
+                else (disproof_threshold, proof_threshold)
+            )
+            child_minimum_threshold = min(
+                minimum_threshold, int(second * (1 + EPSILON)) + 1, INFINITY
+            )
+            child_sum_threshold = min(sum_threshold - total + sums[best], INFINITY)
+            board.make_index_move(moves[best], player)
+            if is_attacker:
+                minimums[best], sums[best] = self._search(
+                    board, 1 - player, child_minimum_threshold, child_sum_threshold
+                )
+            else:
+                sums[best], minimums[best] = self._search(
+                    board, 1 - player, child_sum_threshold, child_minimum_threshold
+                )
+            board.unmake_move()
+        self.table.store(key, proof, disproof, self.nodes - start_nodes + 1)
+        return proof, disproof
+
+    def _expand(self, board: SparseBoard, player: int) -> tuple[int, int, list[int]]:
+        # The moves worth searching, or no moves and the numbers of a position
+        # decided without them.
+        opponent = 1 - player
+        if board.winning_cells(player):
+            return (0, INFINITY, []) if player == self.attacker else (INFINITY, 0, [])
+        opponent_wins = board.winning_cells(opponent)
+        if len(opponent_wins) > 1:
+            return (INFINITY, 0, []) if player == self.attacker else (0, INFINITY, [])
+        if opponent_wins:
+            moves = opponent_wins
+        elif self.threats_only and player == self.attacker:
+            moves = _threat_moves(board, player)
+        else:
+            moves = list(self.geometry.iter_empty_indices(board.occupied))
+        if not moves:
+            # A draw, or no threat left to make: not a win for the attacker.
+            return INFINITY, 0, []
+        return 1, 1, moves
+
+    def _collect_moves(
+        self,
+        board: SparseBoard,
+        player: int,
+        book_moves: dict[int, int],
+        visited: set[int],
+    ) -> None:
+        key = self._key(board, player)
+        if key in visited:
+            return
+        visited.add(key)
+        own_wins = board.winning_cells(player)
+        if own_wins:
+            if player == self.attacker:
+                self._add_book_move(board, player, own_wins[0], book_moves)
+            return
+        _, _, moves = self._expand(board, player)
+        if not moves:
+            return
+        is_attacker = player == self.attacker
+        entries = self._child_entries(board, player, moves)
+        # The proof stored the winning child of the attacker and every child of
+        # the defender as proved. Only if the table has lost some of them is
+        # the position searched again, and then, if its own subtree evicted
+        # them, the children one by one, all within the node budget.
+        if not _is_proved(entries, is_attacker) and not self._out_of_budget():
+            self._search(board, player, INFINITY, INFINITY)
+            entries = self._child_entries(board, player, moves)
+        for index, move in enumerate(moves):
+            if _is_proved(entries, is_attacker) or self._out_of_budget():
+                break
+            if entries[index][0] != 0:
+                board.make_index_move(move, player)
+                proof, disproof = self._search(board, 1 - player, INFINITY, INFINITY)
+                entries[index] = proof, disproof, 0
+                board.unmake_move()
+        proved = [
+            (move, entry[2]) for move, entry in zip(moves, entries) if entry[0] == 0
+        ]
+        if not proved:
+            return
+        if is_attacker:
+            proved = proved[:1]
+        else:
+            proved.sort(key=lambda item: -item[1])
+        self._add_book_move(board, player, proved[0][0], book_moves)
+        for move, _ in proved:
+            board.make_index_move(move, player)
+            self._collect_moves(board, 1 - player, book_moves, visited)
+            board.unmake_move()
+
+    def _child_entries(
+        self, board: SparseBoard, player: int, moves: list[int]
+    ) -> list[tuple[int, int, int]]:
+        # The stored (proof, disproof, work) of every move's position, with
+        # unknown ones not proved.
+        entries = []
+        for move in moves:
+            board.make_index_move(move, player)
+            entries.append(self.table.get(self._key(board, 1 - player)) or (1, 1, 0))
+            board.unmake_move()
+        return entries
+
+    def _add_book_move(
+        self, board: SparseBoard, player: int, move: int, book_moves: dict[int, int]
+    ) -> None:
+        book_moves[board.canonical_key(player == 0)] = self.geometry.symmetries[
+            board.canonical_symmetry()
+        ][move]
+
+    def _out_of_budget(self) -> bool:
+        return self.max_nodes is not None and self.nodes >= self.max_nodes
+
+    def _report_progress(self) -> None:
+        elapsed = perf_counter() - self._start
+        self.report(
+            f"{self.nodes} nodes, {len(self.table)} positions in the table"
+            f" ({(self.nodes - self._start_nodes) / elapsed:.0f} nodes/s)."
+        )
+        if (
+            self.checkpoint_path
+            and perf_counter() - self._last_checkpoint >= CHECKPOINT_SECONDS
+        ):
+            self.save_checkpoint()
+
+
+def _is_proved(entries: list[tuple[int, int, int]], is_attacker: bool) -> bool:
+    # Whether the children's entries prove their parent: one proved child for
+    # the attacker, all of them for the defender.
+    proofs = [entry[0] for entry in entries]
+    return 0 in proofs if is_attacker else not any(proofs)
+
+
+def _threat_moves(board: SparseBoard, player: int) -> list[int]:
+    # Empty cells that leave a line with at most two cells to go and no stone
+    # of the opponent on it.
+    geometry = board.geometry
+    own_counts = board.line_counts[player]
+    opponent_counts = board.line_counts[1 - player]
+    needed = geometry.win_length - 3
+    return [
+        index
+        for index in geometry.iter_empty_indices(board.occupied)
+        if any(
+            own_counts[number] >= needed and not opponent_counts[number]
+            for number in geometry.cell_line_indices[index]
+        )
+    ]
@@ -0,0 +1,249 @@
+import asyncio
+import select
+import socket
+import struct
+from typing import NamedTuple
+
+PROTOCOL_VERSION = 1
+RECV_SIZE = 4096
+
+# Every message is one frame: the payload length as an unsigned 16-bit
+# integer, then the payload, whose first byte is the message type. Integers
+# are big-endian. Frames carry their own length, so readers reassemble them
+# however TCP splits or merges the bytes, and several messages can go out in
+# one write.
+#
+# A connection starts with the host (a peer or the match server) sending
+# Hello with the joining player's index, and the player answering with its
+# own Hello, which the host checks. Moves are cell indices with the Zobrist
+# hash of the position after them, so both ends notice when their boards
+# differ. Close ends a match and says why.
+#
+# A bot service answers each MoveRequest (a position, the player to move and
+# the bot type) with a MoveReply, or with Close if it cannot. The masks of
+# the position take one bit per cell, rounded up to whole bytes.
+#
+# A spectator sends Watch with the number of a match, or 0 for the latest
+# one, and gets a Hello addressed to SPECTATOR, the moves so far and then
+# every new move, until the Close that ends the match.
+FRAME_HEADER = struct.Struct("!H")
+MESSAGE_TYPE = struct.Struct("!B")
+HELLO, MOVE, CLOSE, MOVE_REQUEST, MOVE_REPLY, WATCH = 1, 2, 3, 4, 5, 6
+SPECTATOR = 2  # the player index in the Hello sent to spectators
+HELLO_BODY = struct.Struct("!BHHHBB")
+MOVE_BODY = struct.Struct("!HQ")
+MOVE_REQUEST_HEADER = struct.Struct("!HHHBB")
+MOVE_REPLY_BODY = struct.Struct("!H")
+WATCH_BODY = struct.Struct("!I")
+
+
+class ProtocolError(ConnectionError):
+    pass
+
+
+class Hello(NamedTuple):
+    width: int
+    height: int
+    win_length: int
+    player: int  # the index of the player receiving the message
+    first_player: int
+    version: int = PROTOCOL_VERSION
+
+
+class Move(NamedTuple):
+    index: int
+    state_hash: int
+
+
+class Close(NamedTuple):
+    reason: str
+
+
+class MoveRequest(NamedTuple):
+    width: int
+    height: int
+    win_length: int
+    masks: tuple[int, int]
+    player: int
+    bot_type: int
+
+
+class MoveReply(NamedTuple):
+    index: int
+
+
+class Watch(NamedTuple):
+    match_number: int
+
+
+Message = Hello | Move | Close | MoveRequest | MoveReply | Watch
+
+
+def encode(*messages: Message) -> bytes:
+    frames = []
+    for message in messages:
+        if isinstance(message, Hello):
+            payload = MESSAGE_TYPE.pack(HELLO) + HELLO_BODY.pack(
+                message.version,
+                message.width,
+                message.height,
+                message.win_length,
+                message.player,
+                message.first_player,
+            )
+        elif isinstance(message, Move):
+            payload = MESSAGE_TYPE.pack(MOVE) + MOVE_BODY.pack(*message)
+        elif isinstance(message, MoveRequest):
+            mask_size = _mask_size(message.width, message.height)
+            payload = (
+                MESSAGE_TYPE.pack(MOVE_REQUEST)
+                + MOVE_REQUEST_HEADER.pack(
+                    message.width,
+                    message.height,
+                    message.win_length,
+                    message.player,
+                    message.bot_type,
+                )
+                + b"".join(mask.to_bytes(mask_size, "big") for mask in message.masks)
+            )
+        elif isinstance(message, MoveReply):
+            payload = MESSAGE_TYPE.pack(MOVE_REPLY) + MOVE_REPLY_BODY.pack(*message)
+        elif isinstance(message, Watch):
+            payload = MESSAGE_TYPE.pack(WATCH) + WATCH_BODY.pack(*message)
+        else:
+            payload = MESSAGE_TYPE.pack(CLOSE) + message.reason.encode()
+        frames.append(FRAME_HEADER.pack(len(payload)) + payload)
+    return b"".join(frames)
+
+
+def decode(payload: bytes) -> Message:
+    if not payload:
+        raise ProtocolError("Received an empty message.")
+    message_type, body = payload[0], payload[1:]
+    try:
+        if message_type == HELLO:
+            version, width, height, win_length, player, first_player = (
+                HELLO_BODY.unpack(body)
+            )
+            return Hello(width, height, win_length, player, first_player, version)
+        if message_type == MOVE:
+            return Move(*MOVE_BODY.unpack(body))
+        if message_type == CLOSE:
+            return Close(body.decode(errors="replace"))
+        if message_type == MOVE_REQUEST:
+            width, height, win_length, player, bot_type = (
+                MOVE_REQUEST_HEADER.unpack_from(body)
+            )
+            mask_size = _mask_size(width, height)
+            masks = body[MOVE_REQUEST_HEADER.size :]
+            if len(masks) != 2 * mask_size:
+                raise struct.error
+            return MoveRequest(
+                width,
+                height,
+                win_length,
+                (
+                    int.from_bytes(masks[:mask_size], "big"),
+                    int.from_bytes(masks[mask_size:], "big"),
+                ),
+                player,
+                bot_type,
+            )
+        if message_type == MOVE_REPLY:
+            return MoveReply(*MOVE_REPLY_BODY.unpack(body))
+        if message_type == WATCH:
+            return Watch(*WATCH_BODY.unpack(body))
+    except struct.error:
+        raise ProtocolError(f"Malformed message of type {message_type}.")
+    raise ProtocolError(f"Unknown message type {message_type}.")
+
+
+def _mask_size(width: int, height: int) -> int:
+    return (width * height + 7) // 8
+
+
+def check_hello(hello: Hello, width: int, height: int, win_length: int) -> None:
+    if hello.version != PROTOCOL_VERSION:
+        raise ProtocolError(
+            f"The other side speaks protocol version {hello.version},"
+            f" not {PROTOCOL_VERSION}."
+        )
+    if (hello.width, hello.height, hello.win_length) != (width, height, win_length):
+        raise ProtocolError(
+            f"The other side plays {hello.win_length} in a row on a"
+            f" {hello.width}x{hello.height} board."
+        )
+
+
+class Connection:
+    # Blocking message exchange over a connected socket.
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self._buffer = bytearray()
+
+    def send(self, *messages: Message) -> None:
+        self.sock.sendall(encode(*messages))
+
+    def receive(self) -> Message:
+        (length,) = FRAME_HEADER.unpack(self._receive_exactly(FRAME_HEADER.size))
+        return decode(self._receive_exactly(length))
+
+    def is_readable(self) -> bool:
+        # Whether receive would find some data without blocking, maybe not yet
+        # a whole message.
+        if self._buffer:
+            return True
+        readable, _, _ = select.select((self.sock,), (), (), 0)
+        return bool(readable)
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def _receive_exactly(self, size: int) -> bytes:
+        while len(self._buffer) < size:
+            data = self.sock.recv(RECV_SIZE)
+            if not data:
+                raise ConnectionError("The connection was closed.")
+            self._buffer += data
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def offer_match(
+    connection: Connection, width: int, height: int, win_length: int, player: int
+) -> None:
+    # Host side of the handshake, player is the joining player's index.
+    connection.send(Hello(width, height, win_length, player, 0))
+    reply = connection.receive()
+    try:
+        if not isinstance(reply, Hello):
+            raise ProtocolError("Expected a handshake.")
+        check_hello(reply, width, height, win_length)
+    except ProtocolError as error:
+        connection.send(Close(str(error)))
+        raise
+
+
+def join_match(
+    connection: Connection, width: int, height: int, win_length: int
+) -> Hello:
+    hello = connection.receive()
+    if isinstance(hello, Close):
+        raise ConnectionError(hello.reason)
+    try:
+        if not isinstance(hello, Hello):
+            raise ProtocolError("Expected a handshake.")
+        check_hello(hello, width, height, win_length)
+    except ProtocolError as error:
+        connection.send(Close(str(error)))
+        raise
+    connection.send(
+        Hello(width, height, win_length, 1 - hello.player, hello.first_player)
+    )
+    return hello
+
+
+async def read_message(reader: asyncio.StreamReader) -> Message:
+    (length,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return decode(await reader.readexactly(length))
@@ -0,0 +1,30 @@
+import random
+from typing import Sequence
+
+import numpy as np
+
+# All bots and simulators draw from this one generator, so a seed makes whole
+# games and tournaments reproducible. "fast" is a seedable Mersenne Twister,
+# "secure" draws from the operating system and ignores seeds. It lives apart
+# from utils so that the engine modules load without curses or sockets.
+RNG_TYPES = {"fast": random.Random, "secure": random.SystemRandom}
+rng = random.Random()
+
+
+def use_rng(rng_type: str = "fast", seed: int | str = None) -> None:
+    global rng
+    rng = RNG_TYPES[rng_type](seed)
+
+
+def seed_rng(seed: int | str) -> None:
+    rng.seed(seed)
+
+
+def random_choice(seq: Sequence):
+    return rng.choice(seq)
+
+
+def batch_generator() -> np.random.Generator:
+    # For drawing whole arrays at once, e.g. the moves of many playouts. It is
+    # seeded from rng, so it follows the seed and the type of the shared RNG.
+    return np.random.default_rng(rng.getrandbits(64))
@@ -0,0 +1,289 @@
+import json
+import os
+import threading
+import time
+from time import perf_counter
+from typing import Callable
+
+import transposition
+
+WIN_SCORE = 1 << 30
+MAX_PLY = 1 << 10  # scores beyond WIN_SCORE - MAX_PLY are wins in some plies
+DEFAULT_TIME_LIMIT = 1.0
+TIME_CHECK_INTERVAL = 1024  # nodes between two looks at the clock
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+class SearchStats:
+    # What one search did, for the bot that ran it.
+    def __init__(self, algorithm: str):
+        self.algorithm = algorithm
+        self.nodes = 0
+        self.iterations = 0  # of Monte Carlo searches
+        self.expanded = 0  # nodes whose moves were searched
+        self.children = 0  # moves searched from expanded nodes
+        self.cutoffs = 0
+        self.table_hits = 0
+        self.table_misses = 0
+        self.book_hits = 0
+        self.book_misses = 0
+        self.depth = 0  # of the last complete iteration
+        self.max_ply = 0  # deepest ply reached from the root
+        self.elapsed = 0.0
+
+    @property
+    def branching_factor(self) -> float:
+        return self.children / self.expanded if self.expanded else 0.0
+
+    def to_dict(self) -> dict:
+        return {**vars(self), "branching_factor": self.branching_factor}
+
+
+# Called with the stats of every finished bot search, e.g. to log them or to
+# hand them to a profiler. Hooks run on the searching thread, so they should
+# be quick.
+search_hooks: list[Callable[[SearchStats], None]] = []
+
+
+def report_stats(stats: SearchStats) -> None:
+    for hook in search_hooks:
+        hook(stats)
+
+
+class StatsLog:
+    # A search hook appending the stats of every search to a file, one JSON
+    # object per line with the time and the process it finished in. Several
+    # processes can append to the same file.
+    def __init__(self, path: str):
+        self._file = open(path, "a")
+
+    def __call__(self, stats: SearchStats) -> None:
+        self._file.write(
+            json.dumps({"time": time.time(), "pid": os.getpid(), **stats.to_dict()})
+            + "\n"
+        )
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+# Negamax alpha-beta over any board exposing get_legal_indices,
+# make_index_move/unmake_move, is_winning/is_draw, evaluate and the canonical
+# Zobrist key. Scores are from the point of view of the side to move, wins
+# count down with the ply they happen at so faster wins score higher.
+class Searcher:
+    def __init__(
+        self,
+        time_limit: float = DEFAULT_TIME_LIMIT,
+        max_depth: int = None,
+        transposition_table: transposition.TranspositionTable = None,
+    ):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.transposition_table = (
+            transposition_table
+            if transposition_table is not None
+            else transposition.TranspositionTable()
+        )
+        # Per player, per move index: how often the move caused a cutoff,
+        # weighted by the depth it did it at.
+        self.history_scores = {}
+        self.stats = SearchStats("alpha_beta")  # of the last search
+        # Set from another thread to end the running search within a node, as
+        # if its time was up.
+        self.stop_requested = False
+        self._deadline = None
+
+    def search(
+        self, board, player: int, ponder: bool = False, first_move: int = None
+    ) -> tuple[int, int, int]:
+        # Iterative deepening until the time limit, the depth limit or a
+        # proven result. Returns the best move index, its score and the depth
+        # of the last fully searched iteration. A ponder search has no time
+        # limit, it runs until it is stopped. first_move (e.g. a book move) is
+        # searched first, and played if not even the first iteration ends.
+        self.stats = stats = SearchStats("ponder" if ponder else "alpha_beta")
+        start = perf_counter()
+        self._deadline = (
+            perf_counter() + self.time_limit
+            if self.time_limit is not None and not ponder
+            else None
+        )
+        remaining = board.geometry.cell_count - board.occupied.bit_count()
+        max_depth = min(self.max_depth, remaining) if self.max_depth else remaining
+        best_move, best_score, completed_depth = None, 0, 0
+        for depth in range(1, max_depth + 1):
+            try:
+                move, score = self._search_root(
+                    board, player, depth, best_move if depth > 1 else first_move
+                )
+            except SearchTimeout:
+                break
+            best_move, best_score, completed_depth = move, score, depth
+            if abs(score) >= WIN_SCORE - MAX_PLY:
+                break
+        if best_move is None:
+            best_move = self._order_moves(board, player, first_move)[0]
+        stats.depth = completed_depth
+        stats.elapsed = perf_counter() - start
+        report_stats(stats)
+        return best_move, best_score, completed_depth
+
+    def _search_root(
+        self, board, player: int, depth: int, previous_best: int | None
+    ) -> tuple[int, int]:
+        alpha, beta = -WIN_SCORE, WIN_SCORE
+        best_move = None
+        stats = self.stats
+        stats.expanded += 1
+        for move in self._order_moves(board, player, previous_best):
+            stats.children += 1
+            board.make_index_move(move, player)
+            try:
+                score = -self._negamax(board, 1 - player, depth - 1, -beta, -alpha, 1)
+            finally:
+                board.unmake_move()
+            if best_move is None or score > alpha:
+                best_move, alpha = move, score
+        return best_move, alpha
+
+    def _negamax(
+        self, board, player: int, depth: int, alpha: int, beta: int, ply: int
+    ) -> int:
+        stats = self.stats
+        stats.nodes += 1
+        if ply > stats.max_ply:
+            stats.max_ply = ply
+        if self.stop_requested or (
+            self._deadline is not None
+            and stats.nodes % TIME_CHECK_INTERVAL == 0
+            and perf_counter() > self._deadline
+        ):
+            raise SearchTimeout
+        # Only the player who has just moved can have completed a line.
+        if board.is_winning():
+            return ply - WIN_SCORE
+        if board.is_draw():
+            return 0
+        if depth <= 0:
+            return board.evaluate(player)
+
+        key = board.canonical_key(player == 0)
+        symmetry = board.canonical_symmetry()
+        entry = self.transposition_table.get(key)
+        hash_move = None
+        if entry is None:
+            stats.table_misses += 1
+        else:
+            stats.table_hits += 1
+            score, bound, entry_depth, canonical_move = entry
+            score = _score_from_table(score, ply)
+            if entry_depth >= depth and (
+                bound == transposition.EXACT
+                or (bound == transposition.LOWER_BOUND and score >= beta)
+                or (bound == transposition.UPPER_BOUND and score <= alpha)
+            ):
+                return score
+            if canonical_move is not None:
+                hash_move = board.geometry.inverse_symmetries[symmetry][canonical_move]
+
+        original_alpha = alpha
+        best_score, best_move = -WIN_SCORE, None
+        stats.expanded += 1
+        for move in self._order_moves(board, player, hash_move):
+            stats.children += 1
+            board.make_index_move(move, player)
+            try:
+                score = -self._negamax(
+                    board, 1 - player, depth - 1, -beta, -alpha, ply + 1
+                )
+            finally:
+                board.unmake_move()
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                stats.cutoffs += 1
+                history = self.history_scores.setdefault(player, {})
+                history[move] = history.get(move, 0) + depth * depth
+                break
+
+        if best_score <= original_alpha:
+            bound = transposition.UPPER_BOUND
+        elif best_score >= beta:
+            bound = transposition.LOWER_BOUND
+        else:
+            bound = transposition.EXACT
+        self.transposition_table.store(
+            key,
+            _score_to_table(best_score, ply),
+            bound,
+            depth,
+            board.geometry.symmetries[symmetry][best_move],
+        )
+        return best_score
+
+    def _order_moves(self, board, player: int, first_move: int | None) -> list[int]:
+        # Hash or previous best move first, then by history score, then
+        # closest to the centre.
+        history = self.history_scores.get(player, {})
+        centre_distances = board.geometry.centre_distances
+        moves = sorted(
+            board.get_legal_indices(),
+            key=lambda move: (-history.get(move, 0), centre_distances[move]),
+        )
+        if first_move is not None and first_move in moves:
+            moves.remove(first_move)
+            moves.insert(0, first_move)
+        return moves
+
+
+class Ponderer:
+    # Searches the opponent's position on a thread while the opponent thinks.
+    # The search is thrown away, but its transposition table entries and
+    # history scores stay in the searcher: when it is our turn, the replies
+    # the opponent was likely to play have already been searched some plies
+    # deep.
+    def __init__(self, searcher: Searcher):
+        self.searcher = searcher
+        self._thread = None
+
+    def start(self, board, player: int) -> None:
+        self.stop()
+        self.searcher.stop_requested = False
+        self._thread = threading.Thread(
+            target=self.searcher.search, args=(board.copy(), player, True), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        # Returns once the search has let go of the searcher.
+        if self._thread is None:
+            return
+        self.searcher.stop_requested = True
+        self._thread.join()
+        self._thread = None
+        self.searcher.stop_requested = False
+
+
+# Win scores are stored relative to the node so they stay right when the
+# same position is reached at another ply.
+def _score_to_table(score: int, ply: int) -> int:
+    if score >= WIN_SCORE - MAX_PLY:
+        return score + ply
+    if score <= MAX_PLY - WIN_SCORE:
+        return score - ply
+    return score
+
+
+def _score_from_table(score: int, ply: int) -> int:
+    if score >= WIN_SCORE - MAX_PLY:
+        return score - ply
+    if score <= MAX_PLY - WIN_SCORE:
+        return score + ply
+    return score
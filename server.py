@@ -0,0 +1,304 @@
+import asyncio
+from contextlib import suppress
+from typing import Callable
+
+import gamelog
+import protocol
+import utils
+from bitboard import MARKS, BitBoard
+
+LOBBY_TIMEOUT = 600.0  # seconds a player may wait for an opponent
+MOVE_TIMEOUT = 300.0  # seconds a player may think before forfeiting
+BACKLOG = 1024
+WATCH_TIMEOUT = 10.0  # seconds a spectator may take to say what to watch
+SPECTATOR_BUFFER_LIMIT = 1 << 16  # unsent bytes before a spectator is dropped
+
+# One process hosting many two-player matches. Players are paired in the
+# order they connect, the earlier one plays "x". Like a peer host, the server
+# does the protocol handshake with each player when the match starts, then
+# relays every move to the opponent after checking it and its state hash. A
+# match ends with the game, a disconnect, an illegal move, a desync or a
+# timeout, and the server then closes both connections, telling the players
+# why with a Close message if the game is not over.
+#
+# Spectators connect to a port of their own. Each gets the moves so far in one
+# write, then every move as it is relayed. Their writes are never awaited, so
+# a slow spectator cannot delay the players, it is dropped once too much is
+# queued for it. Finished matches can be appended to a game log.
+
+
+class Seat:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.peer = writer.get_extra_info("peername")
+        # Set once the player's match is over, the connection is then closed.
+        self.done = asyncio.get_running_loop().create_future()
+        self.lobby_read = None  # watches for a disconnect in the lobby
+
+
+class Match:
+    def __init__(self, number: int, board: BitBoard):
+        self.number = number
+        self.board = board
+        self.moves = []  # protocol.Move messages, in order
+        self.spectators = set()  # StreamWriter
+        self.over = asyncio.get_running_loop().create_future()
+
+    def broadcast(self, *messages: protocol.Message) -> None:
+        data = protocol.encode(*messages)
+        for writer in list(self.spectators):
+            if (
+                writer.is_closing()
+                or writer.transport.get_write_buffer_size() > SPECTATOR_BUFFER_LIMIT
+            ):
+                self.spectators.discard(writer)
+                writer.close()
+            else:
+                writer.write(data)
+
+
+class GameServer:
+    def __init__(
+        self,
+        board_size: int,
+        win_length: int = None,
+        lobby_timeout: float = LOBBY_TIMEOUT,
+        move_timeout: float = MOVE_TIMEOUT,
+        game_log: gamelog.GameLog = None,
+        report: Callable[[str], None] = print,
+    ):
+        self.board_size = board_size
+        self.win_length = win_length
+        self.lobby_timeout = lobby_timeout
+        self.move_timeout = move_timeout
+        self.game_log = game_log
+        self.report = report
+        self.matches_started = 0
+        self.matches = {}  # number -> Match, of the active matches
+        self._waiting = None
+
+    @property
+    def active_matches(self) -> int:
+        return len(self.matches)
+
+    async def serve(
+        self,
+        host: str = "localhost",
+        port: int = utils.SERVER_PORT,
+        spectator_port: int = None,
+    ) -> None:
+        server = await asyncio.start_server(
+            self._handle_connection, host, port, backlog=BACKLOG
+        )
+        self.report(f"Serving matches on {host}:{port}.")
+        if spectator_port is None:
+            async with server:
+                await server.serve_forever()
+            return
+        spectator_server = await asyncio.start_server(
+            self._handle_spectator, host, spectator_port, backlog=BACKLOG
+        )
+        self.report(f"Serving spectators on {host}:{spectator_port}.")
+        async with server, spectator_server:
+            await asyncio.gather(
+                server.serve_forever(), spectator_server.serve_forever()
+            )
+
+    async def _handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        seat = Seat(reader, writer)
+        opponent, self._waiting = self._waiting, None
+        if opponent is None:
+            self._waiting = seat
+            await self._wait_for_opponent(seat)
+        else:
+            await self._play_match(opponent, seat)
+        await _close(seat)
+
+    async def _wait_for_opponent(self, seat: Seat) -> None:
+        # Nothing may arrive before the match starts, so a finished read means
+        # the player has left (or broke the protocol) while waiting.
+        seat.lobby_read = asyncio.ensure_future(seat.reader.read(1))
+        await asyncio.wait(
+            (seat.done, seat.lobby_read),
+            timeout=self.lobby_timeout,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if self._waiting is seat:
+            self._waiting = None
+            seat.lobby_read.cancel()
+            seat.done.set_result(None)
+        await seat.done
+
+    async def _play_match(self, x_seat: Seat, o_seat: Seat) -> None:
+        seats = (x_seat, o_seat)
+        self.matches_started += 1
+        match_number = self.matches_started
+        board = BitBoard(self.board_size, win_length=self.win_length)
+        match = self.matches[match_number] = Match(match_number, board)
+        self.report(
+            f"Match {match_number} started: {x_seat.peer} vs {o_seat.peer},"
+            f" {self.active_matches} active."
+        )
+        outcome = gamelog.ABANDONED
+        result = gamelog.describe_outcome(outcome)
+        # A stream can only have one pending read, and the match reads next.
+        x_seat.lobby_read.cancel()
+        with suppress(asyncio.CancelledError):
+            await x_seat.lobby_read
+        geometry = board.geometry
+        try:
+            if x_seat.lobby_read.done() and not x_seat.lobby_read.cancelled():
+                raise ConnectionError
+            for player, seat in enumerate(seats):
+                seat.writer.write(
+                    protocol.encode(
+                        protocol.Hello(
+                            geometry.width,
+                            geometry.height,
+                            geometry.win_length,
+                            player,
+                            0,
+                        )
+                    )
+                )
+            for player, seat in enumerate(seats):
+                await seat.writer.drain()
+                hello = await self._read(seat)
+                if not isinstance(hello, protocol.Hello):
+                    raise protocol.ProtocolError("Expected a handshake.")
+                protocol.check_hello(
+                    hello, geometry.width, geometry.height, geometry.win_length
+                )
+            player = 0
+            while True:
+                message = await self._read(seats[player])
+                if isinstance(message, protocol.Close):
+                    raise ConnectionError(
+                        f'"{MARKS[player]}" left: {message.reason}'
+                    )
+                if not isinstance(message, protocol.Move):
+                    raise protocol.ProtocolError("Expected a move.")
+                if not _is_legal(board, message.index):
+                    raise protocol.ProtocolError(
+                        f'Illegal move {message.index} by "{MARKS[player]}".'
+                    )
+                board.make_index_move(message.index, player)
+                if board.position_key(player == 0) != message.state_hash:
+                    raise protocol.ProtocolError(
+                        f'The board of "{MARKS[player]}" differs.'
+                    )
+                over = board.is_winning() or board.is_draw()
+                outcome = player + 1 if board.is_winning() else gamelog.DRAW
+                result = gamelog.describe_outcome(outcome)
+                # The last move and the end of the match go out in one write.
+                seats[1 - player].writer.write(
+                    protocol.encode(message, protocol.Close(result))
+                    if over
+                    else protocol.encode(message)
+                )
+                match.moves.append(message)
+                match.broadcast(message)
+                await seats[1 - player].writer.drain()
+                if over:
+                    break
+                player = 1 - player
+        except asyncio.TimeoutError:
+            result = f'"{MARKS[player]}" timed out.'
+            _send_close(seats, result)
+        except asyncio.IncompleteReadError:
+            result = "A player disconnected."
+            _send_close(seats, result)
+        except ConnectionError as error:
+            result = str(error) or "A player disconnected."
+            _send_close(seats, result)
+        finally:
+            del self.matches[match_number]
+            x_seat.done.set_result(None)
+            self._end_broadcast(match, result, outcome)
+        self.report(
+            f"Match {match_number} ended: {result} {self.active_matches} active."
+        )
+
+    def _end_broadcast(self, match: Match, result: str, outcome: int) -> None:
+        match.broadcast(protocol.Close(result))
+        for writer in match.spectators:
+            writer.close()
+        match.over.set_result(None)
+        if self.game_log is not None:
+            geometry = match.board.geometry
+            self.game_log.append(
+                gamelog.GameRecord(
+                    geometry.width,
+                    geometry.height,
+                    geometry.win_length,
+                    outcome,
+                    [move.index for move in match.moves],
+                )
+            )
+
+    async def _handle_spectator(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            watch = await asyncio.wait_for(
+                protocol.read_message(reader), WATCH_TIMEOUT
+            )
+            if not isinstance(watch, protocol.Watch):
+                raise protocol.ProtocolError("Expected a match to watch.")
+            match_number = watch.match_number or max(self.matches, default=0)
+            match = self.matches.get(match_number)
+            if match is None:
+                writer.write(
+                    protocol.encode(protocol.Close(f"No match {match_number}."))
+                )
+                await writer.drain()
+                return
+            geometry = match.board.geometry
+            writer.write(
+                protocol.encode(
+                    protocol.Hello(
+                        geometry.width,
+                        geometry.height,
+                        geometry.win_length,
+                        protocol.SPECTATOR,
+                        0,
+                    ),
+                    *match.moves,
+                )
+            )
+            match.spectators.add(writer)
+            # Spectators have nothing more to say, reading notices them leave.
+            left = asyncio.ensure_future(reader.read(1))
+            await asyncio.wait((match.over, left), return_when=asyncio.FIRST_COMPLETED)
+            left.cancel()
+            match.spectators.discard(writer)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read(self, seat: Seat) -> protocol.Message:
+        return await asyncio.wait_for(
+            protocol.read_message(seat.reader), self.move_timeout
+        )
+
+
+def _is_legal(board: BitBoard, index: int) -> bool:
+    return index < board.geometry.cell_count and not board.occupied >> index & 1
+
+
+def _send_close(seats: tuple[Seat, Seat], reason: str) -> None:
+    for seat in seats:
+        if not seat.writer.is_closing():
+            seat.writer.write(protocol.encode(protocol.Close(reason)))
+
+
+async def _close(seat: Seat) -> None:
+    seat.writer.close()
+    try:
+        await seat.writer.wait_closed()
+    except ConnectionError:
+        pass
@@ -0,0 +1,83 @@
+from functools import cache
+
+import numpy as np
+
+import randomness
+from bitboard import BoardGeometry
+
+CHUNK_GAMES = 1 << 14  # games simulated per array pass, bounds the memory use
+DRAW, X_WIN, O_WIN = 0, 1, 2  # outcomes, indexed like utils.play_bots results
+
+# Uniformly random playouts of many games at once. Playing a uniformly random
+# legal move every ply fills the empty cells in a uniformly random order, so a
+# batch of games is a batch of random orders: row g of `times` holds the ply
+# at which game g fills each cell. Once it is known who owns every cell, a win
+# line is completed at the latest time of its cells if one player owns all of
+# them, and the game ends at the earliest completed line.
+
+
+def random_playouts(
+    geometry: BoardGeometry,
+    games: int,
+    masks: tuple[int, int] = (0, 0),
+    player: int = 0,
+    generator: np.random.Generator = None,
+) -> np.ndarray:
+    # Outcome of each of `games` random games continued from the
+    # (non-terminal) position with `player` to move.
+    if generator is None:
+        generator = randomness.batch_generator()
+    empty = np.array(
+        list(geometry.iter_empty_indices(masks[0] | masks[1])), dtype=np.intp
+    )
+    if not empty.size:
+        return np.full(games, DRAW, dtype=np.int8)
+    lines = _line_cells(geometry)
+    # The marks already on the board count as played before the first ply.
+    owners = np.zeros(geometry.cell_count, dtype=np.int8)
+    owners[list(geometry.iter_indices(masks[1]))] = 1
+    outcomes = np.empty(games, dtype=np.int8)
+    for start in range(0, games, CHUNK_GAMES):
+        count = min(CHUNK_GAMES, games - start)
+        order = np.argsort(generator.random((count, empty.size)), axis=1)
+        times = np.full((count, geometry.cell_count), -1, dtype=np.int16)
+        times[np.arange(count)[:, None], empty[order]] = np.arange(
+            empty.size, dtype=np.int16
+        )
+        cell_owners = np.broadcast_to(owners, times.shape).copy()
+        cell_owners[:, empty] = (player + times[:, empty]) % 2
+
+        line_owners = cell_owners[:, lines]
+        owned = (line_owners == line_owners[:, :, :1]).all(axis=2)
+        completed = np.where(
+            owned, times[:, lines].max(axis=2), np.iinfo(np.int16).max
+        )
+        first_line = completed.argmin(axis=1)
+        rows = np.arange(count)
+        outcomes[start : start + count] = np.where(
+            owned[rows, first_line],
+            line_owners[rows, first_line, 0] + 1,
+            DRAW,
+        )
+    return outcomes
+
+
+def simulate_random_games(
+    geometry: BoardGeometry,
+    games: int,
+    masks: tuple[int, int] = (0, 0),
+    player: int = 0,
+    generator: np.random.Generator = None,
+) -> list[int]:
+    # [draws, "x" wins, "o" wins] of `games` random playouts.
+    outcomes = random_playouts(geometry, games, masks, player, generator)
+    return np.bincount(outcomes, minlength=3).tolist()
+
+
+@cache
+def _line_cells(geometry: BoardGeometry) -> np.ndarray:
+    # The cell indices of every win line, one line per row.
+    return np.array(
+        [list(geometry.iter_indices(line)) for line in geometry.win_lines],
+        dtype=np.intp,
+    )
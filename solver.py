@@ -0,0 +1,215 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter
+from typing import Callable
+
+from bitboard import BitBoard, BoardGeometry, get_geometry
+
+PARTS_PER_WORKER = 4  # more parts than workers to even out uneven subtrees
+
+# Retrograde solving of a whole board: every reachable position is visited
+# once per symmetry class, breadth-first by ply, then scored from the last ply
+# back to the empty board. Positions are kept as canonical (x_bits, o_bits)
+# pairs and "x" always moves on even plies.
+#
+# Scores are from the point of view of "x": a win at ply p is worth
+# cell_count + 1 - p for the winner, so faster wins are preferred, 0 is a draw.
+
+
+def solve(
+    geometry: BoardGeometry, report: Callable[[str], None] = print
+) -> dict[int, int]:
+    # Book moves (canonical Zobrist key -> move in the canonical orientation)
+    # of every non-terminal position reachable from the empty board.
+    start = perf_counter()
+    layers = enumerate_layers(geometry, [(0, 0)], 0, report, start)
+    best_moves = solve_layers(geometry, layers, 0, report, start)
+    return to_book_moves(geometry, best_moves)
+
+
+def enumerate_layers(
+    geometry: BoardGeometry,
+    roots: list[tuple[int, int]],
+    first_ply: int,
+    report: Callable[[str], None] = print,
+    start: float = None,
+) -> list[dict[tuple[int, int], int | None]]:
+    # Per ply from first_ply on, the positions reachable from the (canonical,
+    # non-terminal) roots, mapped to their score if terminal or to None.
+    start = start if start is not None else perf_counter()
+    layers = [dict.fromkeys(roots)]
+    ply = first_ply
+    visited = len(roots)
+    while True:
+        next_layer = _next_layer(geometry, layers[-1], ply)
+        if not next_layer:
+            return layers
+        layers.append(next_layer)
+        ply += 1
+        visited += len(next_layer)
+        elapsed = perf_counter() - start
+        report(
+            f"Ply {ply}: {len(next_layer)} positions,"
+            f" {visited} in total ({visited / elapsed:.0f} positions/s)."
+        )
+
+
+def solve_parallel(
+    geometry: BoardGeometry, workers: int, report: Callable[[str], None] = print
+) -> dict[int, int]:
+    # Like solve, but the positions a few plies in are split into parts that
+    # are solved by worker processes. Subtrees shared between parts are solved
+    # by each of them, the partial book moves are merged and the first plies
+    # solved on top of the parts' root scores.
+    if workers <= 1:
+        return solve(geometry, report)
+    start = perf_counter()
+    layers = [{(0, 0): None}]
+    while True:
+        roots = sorted(masks for masks, score in layers[-1].items() if score is None)
+        if not roots or len(roots) >= PARTS_PER_WORKER * workers:
+            break
+        layers.append(_next_layer(geometry, layers[-1], len(layers) - 1))
+    split_ply = len(layers) - 1
+
+    book_moves = {}
+    if roots:
+        part_count = min(len(roots), PARTS_PER_WORKER * workers)
+        report(
+            f"Solving {len(roots)} positions of ply {split_ply} in {part_count}"
+            f" parts on {workers} workers."
+        )
+        with ProcessPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(
+                    _solve_part,
+                    geometry.width,
+                    geometry.height,
+                    geometry.win_length,
+                    roots[i::part_count],
+                    split_ply,
+                )
+                for i in range(part_count)
+            ]
+            for finished, future in enumerate(as_completed(futures), 1):
+                root_scores, part_moves = future.result()
+                layers[-1].update(root_scores)
+                book_moves.update(part_moves)
+                elapsed = perf_counter() - start
+                report(
+                    f"Finished part {finished}/{part_count}: {len(book_moves)}"
+                    f" positions in total ({len(book_moves) / elapsed:.0f}"
+                    " positions/s)."
+                )
+    book_moves.update(
+        to_book_moves(geometry, solve_layers(geometry, layers, 0, report, start))
+    )
+    return book_moves
+
+
+def solve_layers(
+    geometry: BoardGeometry,
+    layers: list[dict[tuple[int, int], int | None]],
+    first_ply: int,
+    report: Callable[[str], None] = print,
+    start: float = None,
+) -> dict[tuple[int, int, int], int]:
+    # Scores every non-terminal position in place, from the last layer back to
+    # the first, and returns the best move of each one keyed by (ply, masks).
+    start = start if start is not None else perf_counter()
+    best_moves = {}
+    solved = 0
+    for offset in range(len(layers) - 2, -1, -1):
+        ply = first_ply + offset
+        player = ply % 2
+        layer, next_layer = layers[offset], layers[offset + 1]
+        for masks, score in layer.items():
+            if score is not None:
+                continue
+            best_score, best_move = None, None
+            occupied = masks[0] | masks[1]
+            for index in geometry.iter_empty_indices(occupied):
+                child, child_score = _play(geometry, masks, player, index, ply)
+                if child_score is None:
+                    child_score = next_layer[geometry.canonical_masks(child)[0]]
+                if (
+                    best_score is None
+                    or (player == 0 and child_score > best_score)
+                    or (player == 1 and child_score < best_score)
+                ):
+                    best_score, best_move = child_score, index
+            layer[masks] = best_score
+            best_moves[(ply, *masks)] = best_move
+            solved += 1
+        elapsed = perf_counter() - start
+        report(
+            f"Solved ply {ply}: {solved} positions in total"
+            f" ({solved / elapsed:.0f} positions/s)."
+        )
+    return best_moves
+
+
+def to_book_moves(
+    geometry: BoardGeometry, best_moves: dict[tuple[int, int, int], int]
+) -> dict[int, int]:
+    # The book is keyed by the minimum of the symmetric Zobrist hashes, whose
+    # orientation is in general not the one of the canonical masks.
+    book_moves = {}
+    for (ply, *masks), move in best_moves.items():
+        bit_board = BitBoard(
+            geometry.width, geometry.height, geometry.win_length, tuple(masks)
+        )
+        book_moves[bit_board.canonical_key(ply % 2 == 0)] = geometry.symmetries[
+            bit_board.canonical_symmetry()
+        ][move]
+    return book_moves
+
+
+def _solve_part(
+    width: int,
+    height: int,
+    win_length: int,
+    roots: list[tuple[int, int]],
+    first_ply: int,
+) -> tuple[dict[tuple[int, int], int], dict[int, int]]:
+    # Worker side of solve_parallel: the roots' scores and the book moves of
+    # everything reachable from them.
+    geometry = get_geometry(width, height, win_length)
+    layers = enumerate_layers(geometry, roots, first_ply, ignore_report)
+    best_moves = solve_layers(geometry, layers, first_ply, ignore_report)
+    return {masks: layers[0][masks] for masks in roots}, to_book_moves(
+        geometry, best_moves
+    )
+
+
+def ignore_report(message: str) -> None:
+    pass
+
+
+def _next_layer(
+    geometry: BoardGeometry, layer: dict[tuple[int, int], int | None], ply: int
+) -> dict[tuple[int, int], int | None]:
+    player = ply % 2
+    next_layer = {}
+    for masks, score in layer.items():
+        if score is not None:
+            continue
+        occupied = masks[0] | masks[1]
+        for index in geometry.iter_empty_indices(occupied):
+            child, child_score = _play(geometry, masks, player, index, ply)
+            next_layer[geometry.canonical_masks(child)[0]] = child_score
+    return next_layer
+
+
+def _play(
+    geometry: BoardGeometry, masks: tuple[int, int], player: int, index: int, ply: int
+) -> tuple[tuple[int, int], int | None]:
+    # The position after player takes the cell and its score if it ends the
+    # game.
+    child = list(masks)
+    child[player] |= 1 << index
+    if geometry.has_line_through(child[player], index):
+        win_score = geometry.cell_count - ply
+        return tuple(child), win_score if player == 0 else -win_score
+    if child[0] | child[1] == geometry.full_mask:
+        return tuple(child), 0
+    return tuple(child), None
@@ -0,0 +1,143 @@
+from bitboard import LINE_WEIGHTS, BitBoard
+
+CANDIDATE_DISTANCE = 2  # cells this far from a stone are worth searching
+SPARSE_MIN_CELLS = 100  # boards with this many cells are played sparse
+
+# A BitBoard for big boards (15x15 Gomoku and the like), where searching every
+# empty cell is hopeless. Besides the masks it keeps up to date on every move:
+#
+# - the frontier, the cells within CANDIDATE_DISTANCE of some stone, from a
+#   count of the stones around every cell;
+# - the number of stones of each player on every win line, from which the
+#   static evaluation is kept as a running sum and the lines one stone short
+#   of a win (threats) are known without a scan.
+#
+# get_legal_indices, which the searchers expand, returns the empty cells of
+# the frontier, or only the cells that win or stop a win when there are any.
+# get_legal_moves still returns every empty cell, those are the rules.
+
+
+class SparseBoard(BitBoard):
+    def __init__(
+        self,
+        width: int,
+        height: int = None,
+        win_length: int = None,
+        masks: tuple[int, int] = (0, 0),
+        candidate_distance: int = CANDIDATE_DISTANCE,
+    ):
+        BitBoard.__init__(self, width, height, win_length, masks)
+        geometry = self.geometry
+        self.candidate_distance = candidate_distance
+        self.neighbour_counts = [0] * geometry.cell_count
+        self.frontier = 0
+        line_count = len(geometry.win_lines)
+        self.line_counts = ([0] * line_count, [0] * line_count)
+        # Per player, the lines it is one stone short of completing and the
+        # other player has no stone on.
+        self.threat_lines = (set(), set())
+        self.score = 0  # evaluate(0), kept up to date move by move
+        for player, mask in enumerate(self.masks):
+            for index in geometry.iter_indices(mask):
+                self._add_stone(player, index)
+
+    def copy(self) -> "SparseBoard":
+        geometry = self.geometry
+        board = SparseBoard(
+            geometry.width,
+            geometry.height,
+            geometry.win_length,
+            tuple(self.masks),
+            self.candidate_distance,
+        )
+        board.history = self.history.copy()
+        return board
+
+    def make_index_move(self, index: int, player: int) -> None:
+        BitBoard.make_index_move(self, index, player)
+        self._add_stone(player, index)
+
+    def unmake_move(self) -> None:
+        player, index = self.history[-1]
+        BitBoard.unmake_move(self)
+        self._remove_stone(player, index)
+
+    def evaluate(self, player: int) -> int:
+        return self.score if player == 0 else -self.score
+
+    def winning_cells(self, player: int) -> list[int]:
+        # The empty cells that would complete a line for player.
+        geometry = self.geometry
+        occupied = self.occupied
+        cells = set()
+        for number in self.threat_lines[player]:
+            cells.update(
+                geometry.iter_indices(geometry.win_lines[number] & ~occupied)
+            )
+        return sorted(cells)
+
+    def get_legal_indices(self) -> list[int]:
+        # Assumes "x" moved first, like the games do.
+        player = self.side_to_move()
+        for forced in (self.winning_cells(player), self.winning_cells(1 - player)):
+            if forced:
+                return forced
+        geometry = self.geometry
+        occupied = self.occupied
+        if not occupied:
+            return [geometry.cell_index((geometry.width // 2, geometry.height // 2))]
+        # A filled up neighbourhood leaves only the cells far from any stone.
+        candidates = self.frontier & ~occupied or geometry.full_mask & ~occupied
+        return list(geometry.iter_indices(candidates))
+
+    def _add_stone(self, player: int, index: int) -> None:
+        geometry = self.geometry
+        neighbour_counts = self.neighbour_counts
+        for neighbour in geometry.neighbourhood(index, self.candidate_distance):
+            if not neighbour_counts[neighbour]:
+                self.frontier |= 1 << neighbour
+            neighbour_counts[neighbour] += 1
+        self._count_lines(player, index, 1)
+
+    def _remove_stone(self, player: int, index: int) -> None:
+        geometry = self.geometry
+        neighbour_counts = self.neighbour_counts
+        for neighbour in geometry.neighbourhood(index, self.candidate_distance):
+            neighbour_counts[neighbour] -= 1
+            if not neighbour_counts[neighbour]:
+                self.frontier &= ~(1 << neighbour)
+        self._count_lines(player, index, -1)
+
+    def _count_lines(self, player: int, index: int, change: int) -> None:
+        win_length = self.geometry.win_length
+        x_counts, o_counts = self.line_counts
+        x_threats, o_threats = self.threat_lines
+        own_counts = self.line_counts[player]
+        score = self.score
+        for number in self.geometry.cell_line_indices[index]:
+            score -= _line_score(x_counts[number], o_counts[number])
+            own_counts[number] += change
+            x_count, o_count = x_counts[number], o_counts[number]
+            score += _line_score(x_count, o_count)
+            if x_count == win_length - 1 and not o_count:
+                x_threats.add(number)
+            else:
+                x_threats.discard(number)
+            if o_count == win_length - 1 and not x_count:
+                o_threats.add(number)
+            else:
+                o_threats.discard(number)
+        self.score = score
+
+
+def _line_score(x_count: int, o_count: int) -> int:
+    # What the line adds to BitBoard.evaluate(0).
+    if not o_count:
+        return LINE_WEIGHTS[x_count]
+    if not x_count:
+        return -LINE_WEIGHTS[o_count]
+    return 0
+
+
+def board_class(width: int, height: int) -> type:
+    return SparseBoard if width * height >= SPARSE_MIN_CELLS else BitBoard
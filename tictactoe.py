@@ -1,20 +1,31 @@
 import socket
-from functools import cache
-import os
-
-from cachelib import FileSystemCache
+from time import perf_counter
 
 import utils
+import book
+import bot_service
+import mcts
+import protocol
+import randomness
+import search
+import simulate
+import transposition
+from bitboard import BitBoard, BoardGeometry
+from sparseboard import board_class
 
-BOARD_SIZE_TTT = 3
-CACHE_DIR = os.getcwd() + (
-    "\\.cache" if os.name == "nt" else "/.cache"
-)  # check os library for this
+FIRST_REMOTE_BOT_TYPE = 2  # random moves are cheaper made than asked for
+ALPHA_BETA_BOT_TYPE = 3
 
-best_move_cache = FileSystemCache(CACHE_DIR, 0, 0)
+opening_books = {}  # geometry -> OpeningBook, or None if there is no book
+bot_client: bot_service.BotClient | None = None  # set to let a service think
+transposition_table = transposition.TranspositionTable()
+searcher = search.Searcher()
+monte_carlo_searcher = mcts.MonteCarloSearcher()
 
 
 class TicTacToeGame(utils.Game):
+    random_bot_type = 1
+
     def __init__(
         self,
         terminal_screen: utils.TerminalScreen,
@@ -22,58 +33,111 @@ class TicTacToeGame(utils.Game):
         current_player: utils.Player,
         player_a: utils.Player,
         player_b: utils.Player,
+        win_length: int = None,
     ):
         utils.Game.__init__(
-            self, terminal_screen, board, current_player, player_a, player_b
+            self, terminal_screen, board, current_player, player_a, player_b, win_length
         )
         self.generating_moves_funcs = [
             self.get_move,
             self.generate_random_move_bot,
             self.minimax_pruning_with_cache_bot,
+            self.alpha_beta_bot,
+            self.monte_carlo_bot,
         ]
 
+    # The nested tuple view is only built for rendering and callers that still
+    # pass boards around, the game itself is played on the bitboard.
+    @property
+    def board(self) -> tuple[tuple[str | None]]:
+        return self.bit_board.to_rows()
+
+    @board.setter
+    def board(self, board: tuple[tuple[str | None]] | BitBoard) -> None:
+        self.bit_board = (
+            board.copy()
+            if isinstance(board, BitBoard)
+            else board_class(len(board[0]), len(board)).from_rows(
+                board, self.win_length
+            )
+        )
+
     def is_winning(self) -> bool:
-        return _find_winner(self.board)
+        return self.bit_board.is_winning()
 
     def is_draw(self) -> bool:
-        return _is_draw_state(self.board)
+        return self.bit_board.is_draw()
 
     def get_legal_moves(self) -> list[tuple[int, int]]:
-        return _get_legal_moves(self.board)
+        return self.bit_board.get_legal_moves()
 
     def make_move(self, move: tuple[int, int]) -> None:
-        self.board = _make_move(self.board, move, self.is_maximizing_players_turn)
+        self.bit_board.make_move(move, self.is_maximizing_players_turn)
+
+    def encode_move(self, move: tuple[int, int]) -> int:
+        return self.bit_board.geometry.cell_index(move)
+
+    def decode_move(self, encoded_move: int) -> tuple[int, int]:
+        return self.bit_board.geometry.index_to_move(encoded_move)
+
+    def state_hash(self) -> int:
+        return self.bit_board.position_key(self.is_maximizing_players_turn)
+
+    def generate_move_from_current_player(self) -> tuple[int, int]:
+        bot_type = self.current_player.bot_type
+        if bot_client is None or bot_type < FIRST_REMOTE_BOT_TYPE:
+            return super().generate_move_from_current_player()
+        bit_board = self.bit_board
+        geometry = bit_board.geometry
+        move = bot_client.best_move(
+            geometry.width,
+            geometry.height,
+            geometry.win_length,
+            bit_board.masks,
+            0 if self.is_maximizing_players_turn else 1,
+            bot_type,
+        )
+        return geometry.index_to_move(move)
 
     def minimax_pruning_with_cache_bot(self) -> tuple[int, int]:
-        cache_key = utils.get_cache_key(
-            self.board, _get_player_mark(self.is_maximizing_players_turn)
+        bit_board = self.bit_board
+        opening_book = get_opening_book(bit_board.geometry)
+        best_move = (
+            opening_book.get_move(bit_board, self.is_maximizing_players_turn)
+            if opening_book
+            else None
         )
-        best_move = utils.get_from_cache(best_move_cache, cache_key)
-        if not best_move:
-            print(f"CACHE NOT FOUND FOR {cache_key}!")
-            legal_moves = _get_legal_moves(self.board)
-            best_move = utils.random_choice(legal_moves)
-            best_move_score = _minimax_score_pruning(
-                _make_move(self.board, best_move, self.is_maximizing_players_turn),
-                not self.is_maximizing_players_turn,
-                None,
+        if best_move is None:
+            stats = search.SearchStats("minimax")
+            stats.book_misses = 1
+            best_move = minimax_best_move(
+                bit_board, self.is_maximizing_players_turn, stats
             )
-            for move in legal_moves:
-                current_move_score = _minimax_score_pruning(
-                    _make_move(self.board, move, self.is_maximizing_players_turn),
-                    not self.is_maximizing_players_turn,
-                    best_move_score,
-                )
-                if (
-                    self.is_maximizing_players_turn
-                    and current_move_score > best_move_score
-                ) or (
-                    not self.is_maximizing_players_turn
-                    and current_move_score < best_move_score
-                ):
-                    best_move, best_move_score = move, current_move_score
-            best_move_cache.set(cache_key, best_move)
-        return best_move
+        else:
+            stats = search.SearchStats("book")
+            stats.book_hits = 1
+            search.report_stats(stats)
+        return bit_board.geometry.index_to_move(best_move)
+
+    def start_pondering(self, bot_type: int) -> search.Ponderer | None:
+        # Only a local alpha-beta bot keeps tables that searching ahead can fill.
+        if bot_type != ALPHA_BETA_BOT_TYPE or bot_client is not None:
+            return None
+        ponderer = search.Ponderer(searcher)
+        ponderer.start(self.bit_board, 0 if self.is_maximizing_players_turn else 1)
+        return ponderer
+
+    def alpha_beta_bot(self) -> tuple[int, int]:
+        move, _, _ = searcher.search(
+            self.bit_board, 0 if self.is_maximizing_players_turn else 1
+        )
+        return self.bit_board.geometry.index_to_move(move)
+
+    def monte_carlo_bot(self) -> tuple[int, int]:
+        move, _, _ = monte_carlo_searcher.search(
+            self.bit_board, 0 if self.is_maximizing_players_turn else 1
+        )
+        return self.bit_board.geometry.index_to_move(move)
 
     def get_move(self) -> tuple[int, int]:
         move = None
@@ -97,7 +161,14 @@ class TicTacToeGame(utils.Game):
         return move
 
     def generate_random_move_bot(self) -> tuple[int, int]:
-        return utils.random_choice(self.get_legal_moves())
+        return randomness.random_choice(self.get_legal_moves())
+
+    @classmethod
+    def play_random_games(
+        cls, board_size: int, win_length: int | None, games: int
+    ) -> list[int]:
+        geometry = BitBoard(*cls.board_shape(board_size, win_length)).geometry
+        return simulate.simulate_random_games(geometry, games)
 
 
 class OnlineTicTacToeGame(TicTacToeGame, utils.OnlineGame):
@@ -108,14 +179,15 @@ class OnlineTicTacToeGame(TicTacToeGame, utils.OnlineGame):
         current_player: utils.Player,
         player_a: utils.Player,
         player_b: utils.Player,
-        gaming_sock: socket.socket,
+        connection: protocol.Connection,
         playing_as_host: bool,
         _waiting_sock: socket.socket = None,
+        win_length: int = None,
     ):
         TicTacToeGame.__init__(
-            self, terminal_screen, board, current_player, player_a, player_b
+            self, terminal_screen, board, current_player, player_a, player_b, win_length
         )
-        utils.OnlineGame.__init__(self, gaming_sock, playing_as_host, _waiting_sock)
+        utils.OnlineGame.__init__(self, connection, playing_as_host, _waiting_sock)
 
 
 # "x": maximizing player
@@ -124,82 +196,107 @@ def _get_player_mark(is_maximizing_players_turn: bool) -> str:
     return "x" if is_maximizing_players_turn else "o"
 
 
-def _get_legal_moves(board: tuple[tuple[str | None]]) -> list[tuple[int, int]]:
-    return [
-        (x, y)
-        for y in range(len(board))
-        for x in range(len(board[y]))
-        if not board[y][x]
-    ]
-
-
-def _make_move(
-    board: tuple[tuple[str | None]],
-    move: tuple[int, int] | str,
-    is_maximizing_players_turn: int,
-) -> tuple[tuple[str | None]]:
-    if type(move) == str:
-        move = (int(move[0]), int(move[1]))
-    new_board = tuple(
-        tuple(
-            _get_player_mark(is_maximizing_players_turn)
-            if x == move[0] and y == move[1]
-            else mark
-            for x, mark in enumerate(row)
-        )
-        for y, row in enumerate(board)
-    )
-    return new_board
-
+def get_opening_book(geometry: BoardGeometry) -> book.OpeningBook | None:
+    if geometry not in opening_books:
+        opening_books[geometry] = book.load_book(geometry)
+    return opening_books[geometry]
 
-def _find_winner(board: tuple[tuple[str | None]]) -> str | None:
-    def check_line(line: list[str | None]) -> bool:
-        return line[0] and len(set(line)) == 1
 
-    lines = []
-    for row in board:
-        lines.append(list(row))
-    for i in range(BOARD_SIZE_TTT):
-        lines.append([board[j][i] for j in range(BOARD_SIZE_TTT)])
-    lines.append([board[j][j] for j in range(BOARD_SIZE_TTT)])
-    lines.append([board[j][BOARD_SIZE_TTT - 1 - j] for j in range(BOARD_SIZE_TTT)])
-
-    for line in lines:
-        if check_line(line):
-            return line[0]
-    return None
+def minimax_best_move(
+    bit_board: BitBoard,
+    is_maximizing_players_turn: bool,
+    stats: search.SearchStats = None,
+) -> int:
+    stats = stats if stats is not None else search.SearchStats("minimax")
+    start = perf_counter()
+    root_ply = len(bit_board.history)
+    legal_moves = bit_board.get_legal_indices()
+    stats.expanded += 1
+    stats.children += len(legal_moves) + 1
+    best_move = randomness.random_choice(legal_moves)
+    best_move_score = _score_after_move(
+        bit_board, best_move, is_maximizing_players_turn, None, stats
+    )
+    for move in legal_moves:
+        current_move_score = _score_after_move(
+            bit_board, move, is_maximizing_players_turn, best_move_score, stats
+        )
+        if (is_maximizing_players_turn and current_move_score > best_move_score) or (
+            not is_maximizing_players_turn and current_move_score < best_move_score
+        ):
+            best_move, best_move_score = move, current_move_score
+    # The search is exhaustive, and max_ply was counted from the empty board.
+    stats.max_ply -= root_ply
+    stats.depth = stats.max_ply
+    stats.elapsed = perf_counter() - start
+    search.report_stats(stats)
+    return best_move
 
 
-def _is_draw_state(board: tuple[tuple[str | None]]) -> bool:
-    return all([cell for row in board for cell in row])
+def _score_after_move(
+    bit_board: BitBoard,
+    move: int,
+    is_maximizing_players_turn: bool,
+    threshold: int | None,
+    stats: search.SearchStats,
+) -> int:
+    bit_board.make_index_move(move, 0 if is_maximizing_players_turn else 1)
+    score = _minimax_score_pruning(
+        bit_board, not is_maximizing_players_turn, threshold, stats
+    )
+    bit_board.unmake_move()
+    return score
 
 
-@cache
 def _minimax_score_pruning(
-    board: tuple[tuple[str | None]],
+    bit_board: BitBoard,
     is_maximizing_players_turn: bool,
     threshold: int | None,
+    stats: search.SearchStats,
 ) -> int:
-    winner = _find_winner(board)
-    if winner:
-        return 1 if winner == "x" else -1
-    if _is_draw_state(board):
+    stats.nodes += 1
+    stats.max_ply = max(stats.max_ply, len(bit_board.history))
+    # Only the player who has just moved can have completed a line.
+    if bit_board.is_winning():
+        return -1 if is_maximizing_players_turn else 1
+    if bit_board.is_draw():
         return 0
 
-    legal_moves = _get_legal_moves(board)
+    # The threshold is the beta of a maximizing node and the alpha of a
+    # minimizing one, cut off subtrees only give a bound on the score.
+    geometry = bit_board.geometry
+    cache_key = bit_board.canonical_key(is_maximizing_players_turn)
+    depth = geometry.cell_count - bit_board.occupied.bit_count()
+    score = transposition_table.probe(
+        cache_key,
+        depth,
+        None if is_maximizing_players_turn else threshold,
+        threshold if is_maximizing_players_turn else None,
+    )
+    if score is not None:
+        stats.table_hits += 1
+        return score
+    stats.table_misses += 1
+
     current_best_score = None
-    for move in legal_moves:
-        new_board = _make_move(board, move, is_maximizing_players_turn)
-        score = _minimax_score_pruning(
-            new_board,
-            not is_maximizing_players_turn,
-            current_best_score,
+    bound = transposition.EXACT
+    stats.expanded += 1
+    for move in geometry.iter_empty_indices(bit_board.occupied):
+        stats.children += 1
+        score = _score_after_move(
+            bit_board, move, is_maximizing_players_turn, current_best_score, stats
         )
         if threshold != None and (
             (is_maximizing_players_turn and score >= threshold)
             or (not is_maximizing_players_turn and score <= threshold)
         ):
+            stats.cutoffs += 1
             current_best_score = score
+            bound = (
+                transposition.LOWER_BOUND
+                if is_maximizing_players_turn
+                else transposition.UPPER_BOUND
+            )
             break
         if current_best_score == None:
             current_best_score = score
@@ -210,4 +307,5 @@ def _minimax_score_pruning(
                 else min(current_best_score, score)
             )
 
+    transposition_table.store(cache_key, current_best_score, bound, depth)
     return current_best_score
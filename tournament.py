@@ -0,0 +1,198 @@
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import permutations
+from math import sqrt
+from time import perf_counter
+from typing import Callable, Sequence, Type
+
+import randomness
+import utils
+
+GAMES_PER_BATCH = 200
+RANDOM_GAMES_PER_BATCH = 1 << 16  # random bots' games are simulated in bulk
+Z_95 = 1.959964  # standard normal quantile of a 95% two-sided interval
+
+# Bot-vs-bot matches played in batches over a process pool. Every batch
+# reseeds the shared RNG from the tournament seed, the pairing and its own
+# index, so the games of bots that only depend on the RNG replay the same
+# whatever the worker count. Time-limited searches still depend on the clock.
+#
+# Results are [draws, first bot wins, second bot wins] like utils.play_bots
+# returns them, the first bot always plays "x".
+
+
+def play_match(
+    bot_type_one: int,
+    bot_type_two: int,
+    game_type_class: Type,
+    board_size: int,
+    games: int,
+    workers: int = 1,
+    win_length: int = None,
+    seed: int = None,
+    report: Callable[[str], None] = print,
+    initializer: Callable = None,
+    initargs: tuple = (),
+) -> list[int]:
+    return play_tournament(
+        [(bot_type_one, bot_type_two)],
+        game_type_class,
+        board_size,
+        games,
+        workers,
+        win_length,
+        seed,
+        report,
+        initializer,
+        initargs,
+    )[(bot_type_one, bot_type_two)]
+
+
+def play_round_robin(
+    bot_types: Sequence[int],
+    game_type_class: Type,
+    board_size: int,
+    games: int,
+    workers: int = 1,
+    win_length: int = None,
+    seed: int = None,
+    report: Callable[[str], None] = print,
+    initializer: Callable = None,
+    initargs: tuple = (),
+) -> dict[tuple[int, int], list[int]]:
+    # Every bot type plays every other one, once with each mark.
+    return play_tournament(
+        list(permutations(bot_types, 2)),
+        game_type_class,
+        board_size,
+        games,
+        workers,
+        win_length,
+        seed,
+        report,
+        initializer,
+        initargs,
+    )
+
+
+def play_tournament(
+    pairings: list[tuple[int, int]],
+    game_type_class: Type,
+    board_size: int,
+    games: int,
+    workers: int = 1,
+    win_length: int = None,
+    seed: int = None,
+    report: Callable[[str], None] = print,
+    initializer: Callable = None,
+    initargs: tuple = (),
+) -> dict[tuple[int, int], list[int]]:
+    # Plays `games` games per pairing and reports the running results of a
+    # pairing whenever one of its batches finishes. initializer(*initargs) is
+    # run once per worker, e.g. to configure the bots of a spawned process.
+    seed = seed if seed is not None else random.SystemRandom().getrandbits(64)
+    batches = [
+        (
+            pairing,
+            (
+                *pairing,
+                game_type_class,
+                board_size,
+                win_length,
+                min(batch_size, games - first_game),
+                f"{seed}:{pairing[0]}:{pairing[1]}:{index}",
+            ),
+        )
+        for pairing in pairings
+        for batch_size in [_batch_size(*pairing, game_type_class)]
+        for index, first_game in enumerate(range(0, games, batch_size))
+    ]
+    results = {pairing: [0, 0, 0] for pairing in pairings}
+    start = perf_counter()
+    played = 0
+
+    def add_batch(pairing: tuple[int, int], batch_results: list[int]) -> None:
+        nonlocal played
+        pairing_results = results[pairing]
+        for outcome, count in enumerate(batch_results):
+            pairing_results[outcome] += count
+        played += sum(batch_results)
+        report(
+            f"Bots {pairing[0]} vs {pairing[1]}: "
+            + format_results(pairing_results)
+            + f" ({played / (perf_counter() - start):.0f} games/s)"
+        )
+
+    report(f"Playing {games} games per pairing with seed {seed}.")
+    if workers <= 1:
+        if initializer:
+            initializer(*initargs)
+        for pairing, batch_args in batches:
+            add_batch(pairing, _play_batch(*batch_args))
+        return results
+
+    with ProcessPoolExecutor(
+        workers, initializer=initializer, initargs=initargs
+    ) as executor:
+        futures = {
+            executor.submit(_play_batch, *batch_args): pairing
+            for pairing, batch_args in batches
+        }
+        for future in as_completed(futures):
+            add_batch(futures[future], future.result())
+    return results
+
+
+def wilson_interval(
+    successes: int, trials: int, z: float = Z_95
+) -> tuple[float, float]:
+    # Confidence interval of a binomial proportion, unlike the normal
+    # approximation it stays within [0, 1] for rates close to 0 or 1.
+    if not trials:
+        return 0.0, 1.0
+    rate = successes / trials
+    denominator = 1 + z * z / trials
+    center = (rate + z * z / (2 * trials)) / denominator
+    half_width = (
+        z * sqrt(rate * (1 - rate) / trials + z * z / (4 * trials * trials))
+    ) / denominator
+    return max(0.0, center - half_width), min(1.0, center + half_width)
+
+
+def format_results(results: list[int]) -> str:
+    games = sum(results)
+    parts = [f"{games} games"]
+    for name, count in zip(("draw", "first", "second"), results):
+        low, high = wilson_interval(count, games)
+        parts.append(
+            f"{name} {count * 100 / games:.1f}% [{low * 100:.1f}, {high * 100:.1f}]"
+        )
+    return ", ".join(parts)
+
+
+def _batch_size(bot_type_one: int, bot_type_two: int, game_type_class: Type) -> int:
+    if bot_type_one == bot_type_two == game_type_class.random_bot_type:
+        return RANDOM_GAMES_PER_BATCH
+    return GAMES_PER_BATCH
+
+
+def _play_batch(
+    bot_type_one: int,
+    bot_type_two: int,
+    game_type_class: Type,
+    board_size: int,
+    win_length: int,
+    games: int,
+    seed: str,
+) -> list[int]:
+    randomness.seed_rng(seed)
+    if bot_type_one == bot_type_two == game_type_class.random_bot_type:
+        return game_type_class.play_random_games(board_size, win_length, games)
+    results = [0, 0, 0]
+    for _ in range(games):
+        results[
+            utils.play_bots(
+                bot_type_one, bot_type_two, game_type_class, board_size, win_length
+            )
+        ] += 1
+    return results
@@ -0,0 +1,65 @@
+from typing import Hashable
+
+# Bound types of a stored score.
+EXACT = 0
+LOWER_BOUND = 1  # the real score is at least the stored one
+UPPER_BOUND = 2  # the real score is at most the stored one
+
+DEFAULT_TABLE_SIZE = 1 << 18
+
+
+class TranspositionTable:
+    # Fixed number of buckets with two slots each: the first keeps the entry
+    # searched deepest, the second always takes the newest one. Memory stays
+    # flat no matter how many positions are searched.
+    def __init__(self, size: int = DEFAULT_TABLE_SIZE):
+        self.bucket_count = max(size // 2, 1)
+        self.slots = [None] * (self.bucket_count * 2)
+
+    def __len__(self) -> int:
+        return sum(1 for slot in self.slots if slot is not None)
+
+    def clear(self) -> None:
+        self.slots = [None] * (self.bucket_count * 2)
+
+    def get(self, key: Hashable) -> tuple[int, int, int, int | None] | None:
+        slot_index = hash(key) % self.bucket_count * 2
+        for entry in self.slots[slot_index : slot_index + 2]:
+            if entry is not None and entry[0] == key:
+                return entry[1:]
+        return None
+
+    def probe(
+        self, key: Hashable, depth: int, alpha: int | None, beta: int | None
+    ) -> int | None:
+        # A score that can be used as is for a search of the given depth and
+        # window, or None if the position has to be searched.
+        entry = self.get(key)
+        if entry is None:
+            return None
+        score, bound, entry_depth, _ = entry
+        if entry_depth < depth:
+            return None
+        if (
+            bound == EXACT
+            or (bound == LOWER_BOUND and beta is not None and score >= beta)
+            or (bound == UPPER_BOUND and alpha is not None and score <= alpha)
+        ):
+            return score
+        return None
+
+    def store(
+        self, key: Hashable, score: int, bound: int, depth: int, move: int = None
+    ) -> None:
+        # move is the best move found, kept to be tried first next time.
+        self._store_entry((key, score, bound, depth, move))
+
+    def _store_entry(self, entry: tuple) -> None:
+        # entry is the key, the stored values and, fourth, the weight that
+        # decides who keeps the first slot: here the depth.
+        slot_index = hash(entry[0]) % self.bucket_count * 2
+        heaviest = self.slots[slot_index]
+        if heaviest is None or heaviest[0] == entry[0] or heaviest[3] <= entry[3]:
+            self.slots[slot_index] = entry
+        else:
+            self.slots[slot_index + 1] = entry
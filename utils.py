@@ -1,23 +1,35 @@
-import os
 import socket
 import argparse
-from time import sleep
-from cachelib import FileSystemCache
-from typing import Sequence, Any, Type
+from typing import Any, Type
 import curses
 
+import protocol
+import search
+
 SERVER_PORT = 12480
 RECV_SIZE = 1024
 
 
+ENTER_KEYS = {ord("\n"), ord("\r"), curses.KEY_ENTER}
+BACKSPACE_KEYS = {8, 127, curses.KEY_BACKSPACE}
+LEAVE_KEY = ord("q")
+
+
+# Nothing here sleeps or blocks on the keyboard alone: keys are read with a
+# short timeout, and in between the screen checks the connection of an online
+# game, so a message from the opponent is handled while you type and keys
+# while you wait for the opponent.
 class TerminalScreen:
-    refresh_interval = 0.4
+    input_poll_interval_ms = 20
     info_zone_buffer_height = 5
 
     def __init__(self, window: curses.window, info_line_num_start: int):
         self.window = window
         self.info_line_num_start = info_line_num_start
         self.info_line_num_offset = 0
+        self.watched_connection: protocol.Connection | None = None
+        self.window.timeout(self.input_poll_interval_ms)
+        self.window.keypad(True)
 
     @property
     def current_info_line_num(self) -> int:
@@ -32,18 +44,53 @@ class TerminalScreen:
         ) % self.info_zone_buffer_height
         self.window.move(self.current_info_line_num, 0)
         self.window.refresh()
-        sleep(self.refresh_interval)
 
     def get_ascii_input(self, prompt_message: str) -> str:
         self.show_info_message(prompt_message)
-        curses.echo()
+        line_num = self.current_info_line_num
         self.window.clrtoeol()
-        ascii_input = self.window.getstr(self.current_info_line_num, 0).decode("ascii")
+        chars = []
+        while (key := self.get_key()) not in ENTER_KEYS:
+            if key in BACKSPACE_KEYS and chars:
+                chars.pop()
+                self.window.addstr(line_num, len(chars), " ")
+                self.window.move(line_num, len(chars))
+            elif 32 <= key < 127:
+                self.window.addstr(line_num, len(chars), chr(key))
+                chars.append(chr(key))
+            self.window.refresh()
         self.info_line_num_offset = (
             self.info_line_num_offset + 1
         ) % self.info_zone_buffer_height
-        curses.noecho()
-        return ascii_input
+        return "".join(chars)
+
+    def get_key(self) -> int:
+        while True:
+            self._check_watched_connection()
+            key = self.window.getch()
+            if key != -1:
+                return key
+
+    def wait_for_message(self, connection: protocol.Connection) -> None:
+        # Until the connection has something to read, or the player leaves.
+        while not connection.is_readable():
+            if self.window.getch() == LEAVE_KEY:
+                raise ConnectionAbortedError("You left the game.")
+
+    def wait_for_any_key(self) -> None:
+        self.window.timeout(-1)
+        self.window.getch()
+        self.window.timeout(self.input_poll_interval_ms)
+
+    def _check_watched_connection(self) -> None:
+        # It is your turn, so the opponent can only have closed the match.
+        connection = self.watched_connection
+        if connection is None or not connection.is_readable():
+            return
+        message = connection.receive()
+        if isinstance(message, protocol.Close):
+            raise ConnectionError(message.reason)
+        raise protocol.ProtocolError("Your opponent sent a message out of turn.")
 
     def get_online_mode(self) -> bool:
         playing_as_host = None
@@ -76,42 +123,27 @@ class TerminalScreen:
         return bot_type
 
 
-def _random_int(width: int) -> int:
-    bres = os.urandom(width)
-    ires = int.from_bytes(bres, "little")
-    return ires
-
-
-def random_choice(seq: Sequence):
-    return seq[_random_int(1) % len(seq)]
-
-
-def host_the_game() -> socket.socket:
+def host_the_game(host_name: str, port: int = SERVER_PORT) -> socket.socket:
     host_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    host_socket.bind(("localhost", SERVER_PORT))
+    host_socket.bind((host_name, port))
     host_socket.listen(1)
     return host_socket
 
 
-def connect_to_host(host_name: str) -> socket.socket:
+def connect_to_host(host_name: str, port: int = SERVER_PORT) -> socket.socket:
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_socket.connect((host_name, SERVER_PORT))
+    client_socket.connect((host_name, port))
     return client_socket
 
 
-def create_board(board_size: int) -> tuple[tuple[None]]:
-    return tuple([tuple([None for _ in range(board_size)]) for _ in range(board_size)])
+def board_dimensions(board_size: int | tuple[int, int]) -> tuple[int, int]:
+    # Width and height, a single number is the side of a square board.
+    return board_size if isinstance(board_size, tuple) else (board_size, board_size)
 
 
-def get_cache_key(board: tuple[tuple[str | None]], player_mark: str) -> str:
-    return "".join(
-        [mark if mark else " " for row in board for mark in row] + [player_mark]
-    )
-
-
-def get_from_cache(best_move_cache: FileSystemCache, cache_key: str) -> Any:
-    move = best_move_cache.get(cache_key)
-    return move
+def create_board(width: int, height: int = None) -> tuple[tuple[None]]:
+    height = height if height else width
+    return tuple([tuple([None for _ in range(width)]) for _ in range(height)])
 
 
 class Player:
@@ -146,6 +178,8 @@ class OnlinePlayer(Player):
 
 
 class Game:
+    random_bot_type = None  # bot type whose games play_random_games can batch
+
     def __init__(
         self,
         terminal_screen: TerminalScreen,
@@ -153,14 +187,17 @@ class Game:
         current_player: Player,
         player_a: Player,
         player_b: Player,
+        win_length: int = None,
     ):
         self.terminal_screen = terminal_screen
+        self.win_length = win_length  # k in a row, None for the board size
         self.board = board
         self.board_size = len(self.board)
         self.current_player = current_player
         self.player_a = player_a  # max player
         self.player_b = player_b  # min player
         self.generating_moves_funcs = []
+        self._rendered_board = None
 
     @property
     def is_maximizing_players_turn(self) -> bool:
@@ -178,23 +215,52 @@ class Game:
         pass
 
     def render(self) -> None:
+        # The whole board the first time, then only the cells that changed.
+        window = self.terminal_screen.window
+        board = self.board
+        if self._rendered_board is None:
+            self._render_all(board)
+        else:
+            row_label_width, column_width = _label_widths(board)
+            for i, (row, rendered_row) in enumerate(zip(board, self._rendered_board)):
+                for x, (cell, rendered_cell) in enumerate(zip(row, rendered_row)):
+                    if cell != rendered_cell:
+                        window.addstr(
+                            i + 2, row_label_width + 3 + column_width * x, cell or " "
+                        )
+        self._rendered_board = board
+        window.refresh()
+
+    def _render_all(self, board: tuple[tuple[str | None]]) -> None:
         def render_line(line: str) -> None:
             nonlocal j
             self.terminal_screen.window.addstr(j, 0, line)
             j += 1
 
         j = 0
-        render_line("    " + " ".join([str(i) for i in range(self.board_size)]))
-        render_line("   " + " ".join(["-" for _ in range(self.board_size + 1)]))
-        for i, row in enumerate(self.board):
-            out_str = [f"{i} | "]
+        width = len(board[0])
+        row_label_width, column_width = _label_widths(board)
+        border = " " * (row_label_width + 2) + ("-".ljust(column_width)) * width + "-"
+        render_line(
+            " " * (row_label_width + 3)
+            + "".join([str(i).ljust(column_width) for i in range(width)]).rstrip()
+        )
+        render_line(border)
+        for i, row in enumerate(board):
+            out_str = [f"{i:>{row_label_width}} | "]
             for cell in row:
-                out_str.append(cell + " " if cell else "  ")
+                out_str.append((cell or " ").ljust(column_width))
             out_str.append("|")
             render_line("".join(out_str))
-        render_line("   " + " ".join(["-" for _ in range(self.board_size + 1)]))
-        self.terminal_screen.window.refresh()
-        sleep(self.terminal_screen.refresh_interval)
+        render_line(border)
+
+    @classmethod
+    def board_shape(
+        cls, board_size: int | tuple[int, int], win_length: int | None
+    ) -> tuple[int, int, int]:
+        # Width, height and win length of a game played with these settings.
+        width, height = board_dimensions(board_size)
+        return width, height, win_length if win_length else min(width, height)
 
     def generate_move_from_current_player(self) -> Any:
         next_move = self.generating_moves_funcs[self.current_player.bot_type]()
@@ -212,20 +278,39 @@ class Game:
     def make_a_move_from_current_player(self) -> None:
         self.make_move(self.generate_move_from_current_player())
 
+    # Moves and positions as they are sent over the network.
+    def encode_move(self, move: Any) -> int:
+        pass
+
+    def decode_move(self, encoded_move: int) -> Any:
+        pass
+
+    def state_hash(self) -> int:
+        pass
+
     def minimax_pruning_with_cache_bot(self, board: tuple[tuple[str | None]]) -> Any:
         pass
 
+    def start_pondering(self, bot_type: int) -> search.Ponderer | None:
+        # Lets a bot of this type think on the opponent's time, if it can.
+        pass
+
+    @classmethod
+    def play_random_games(
+        cls, board_size: int, win_length: int | None, games: int
+    ) -> list[int]:
+        # Results of games between two random bots, like repeated play_bots.
+        pass
 
-class OnlineGame(Game):
-    recv_size = 1024
 
+class OnlineGame(Game):
     def __init__(
         self,
-        gaming_sock: socket.socket,
+        connection: protocol.Connection,
         playing_as_host: bool,
         _waiting_sock: socket.socket = None,
     ):
-        self.gaming_sock = gaming_sock
+        self.connection = connection
         self.playing_as_host = playing_as_host
         self._waiting_sock = _waiting_sock
 
@@ -239,36 +324,70 @@ class OnlineGame(Game):
     def close(self) -> None:
         if self.playing_as_host:
             self.waiting_sock.close()
-        self.gaming_sock.close()
+        self.connection.close()
 
-    def generate_move_from_current_player(self) -> Any | str:
-        # Online game? Need to send the move to your opponent.
+    def make_a_move_from_current_player(self) -> None:
+        # Online game? Need to send the move to your opponent, with the hash of
+        # the position after it so that either side notices a desync.
         if self.current_player.is_yourself:
-            next_move = super().generate_move_from_current_player()
-            self.gaming_sock.sendall(bytes(next_move))
+            # Only while it is your turn can a message from the opponent be
+            # out of turn, before that its first move may already be on its
+            # way and stays unread in the connection.
+            self.terminal_screen.watched_connection = self.connection
+            try:
+                next_move = self.generate_move_from_current_player()
+            finally:
+                self.terminal_screen.watched_connection = None
+            self.make_move(next_move)
+            self.connection.send(
+                protocol.Move(self.encode_move(next_move), self.state_hash())
+            )
             self.terminal_screen.show_info_message(
                 "Your move has been sent to your opponent."
             )
-            # decoded type
-        else:
-            self.terminal_screen.show_info_message("Waiting for your opponent to move.")
-            next_move = self.gaming_sock.recv(self.recv_size)
-            # str type
-        return next_move
+            return
+        self.terminal_screen.show_info_message(
+            "Waiting for your opponent to move, press q to leave."
+        )
+        yourself = self.player_a if self.player_a.is_yourself else self.player_b
+        ponderer = self.start_pondering(yourself.bot_type)
+        try:
+            self.terminal_screen.wait_for_message(self.connection)
+        finally:
+            if ponderer is not None:
+                ponderer.stop()
+        message = self.connection.receive()
+        if isinstance(message, protocol.Close):
+            raise ConnectionError(message.reason)
+        if not isinstance(message, protocol.Move):
+            raise protocol.ProtocolError("Expected a move.")
+        next_move = self.decode_move(message.index)
+        if next_move not in self.get_legal_moves():
+            raise protocol.ProtocolError("Your opponent played an illegal move.")
+        self.make_move(next_move)
+        if self.state_hash() != message.state_hash:
+            self.connection.send(protocol.Close("The boards differ."))
+            raise protocol.ProtocolError("Your board and your opponent's differ.")
 
 
 def play_bots(
-    bot_type_one: int, bot_type_two: int, game_type_class: Type, board_size: int
+    bot_type_one: int,
+    bot_type_two: int,
+    game_type_class: Type,
+    board_size: int,
+    win_length: int = None,
 ) -> int:
     player_one, player_two = Player("x", bot_type=bot_type_one), Player(
         "o", bot_type=bot_type_two
     )
+    width, height, _ = game_type_class.board_shape(board_size, win_length)
     game: Game = game_type_class(
         None,
-        board_size,
+        create_board(width, height),
         player_one,
         player_one,
         player_two,
+        win_length=win_length,
     )
     while True:
         game.make_a_move_from_current_player()
@@ -284,24 +403,6 @@ def play_bots(
     return result
 
 
-def repeat_games(
-    bot_type_one: int,
-    bot_type_two: int,
-    game_type_class: Type,
-    board_size: int,
-    repeat_times: int,
-) -> None:
-    results = [0, 0, 0]
-    for _ in range(repeat_times):
-        results[play_bots(bot_type_one, bot_type_two, game_type_class, board_size)] += 1
-    print(
-        f"Games played: {repeat_times}\n"
-        f"Draw: {results[0] * 100 / repeat_times}%\n"
-        f"First bot winning: {results[1] * 100 / repeat_times}%\n"
-        f"Second bot winning: {results[2] * 100 / repeat_times}%"
-    )
-
-
 def initialize_game(
     terminal_screen: TerminalScreen,
     args: argparse.Namespace,
@@ -310,19 +411,27 @@ def initialize_game(
     max_bot_index: int,
     board_size: int,
 ) -> Game:
+    width, height, win_length = game_class.board_shape(board_size, args.win_length)
     if args.online:
         playing_as_host = terminal_screen.get_online_mode()
         # host
         if playing_as_host:
-            waiting_sock = host_the_game()
+            waiting_sock = host_the_game(args.host, args.port)
             terminal_screen.show_info_message("Waiting for connection.")
             gaming_sock, _ = waiting_sock.accept()
+            connection = protocol.Connection(gaming_sock)
+            protocol.offer_match(connection, width, height, win_length, 1)
             terminal_screen.show_info_message(f"A player has joined your game!")
-        # not host
+            is_yourself_player_a = True
+            first_player = 0
+        # not host, the other player may be a peer host or on a match server
         else:
             terminal_screen.show_info_message("Connecting.")
-            gaming_sock = connect_to_host("localhost")
-        is_yourself_player_a = True if playing_as_host else False
+            connection = protocol.Connection(connect_to_host(args.host, args.port))
+            terminal_screen.show_info_message("Waiting for an opponent.")
+            hello = protocol.join_match(connection, width, height, win_length)
+            is_yourself_player_a = hello.player == 0
+            first_player = hello.first_player
         player_a = OnlinePlayer(
             "x", is_yourself_player_a, (terminal_screen, max_bot_index)
         )
@@ -331,18 +440,29 @@ def initialize_game(
         )
         game = online_game_class(
             terminal_screen,
-            create_board(board_size),
-            player_a,
+            create_board(width, height),
+            player_a if first_player == 0 else player_b,
             player_a,
             player_b,
-            gaming_sock,
+            connection,
             playing_as_host,
             waiting_sock if playing_as_host else None,
+            win_length=args.win_length,
         )
     else:
         player_a = Player("x", (terminal_screen, max_bot_index))
         player_b = Player("o", (terminal_screen, max_bot_index))
         game = game_class(
-            terminal_screen, create_board(board_size), player_a, player_a, player_b
+            terminal_screen,
+            create_board(width, height),
+            player_a,
+            player_a,
+            player_b,
+            win_length=args.win_length,
         )
     return game
+
+
+def _label_widths(board: tuple[tuple[str | None]]) -> tuple[int, int]:
+    # Of the row numbers, and of a column: its number and a space.
+    return len(str(len(board) - 1)), len(str(len(board[0]) - 1)) + 1